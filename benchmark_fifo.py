@@ -0,0 +1,294 @@
+"""
+Fifo Benchmark
+==============
+
+Times fifo.Inventory on generated ledgers of growing size and records the peak memory::
+
+	$ python benchmark_fifo.py --sizes 100 10000 1000000 --output results.json
+
+A saved run can serve as the baseline of a later one, the exit status is 1
+when any timing or peak memory grew by more than the tolerance::
+
+	$ python benchmark_fifo.py --output new.json --baseline results.json --tolerance 0.25
+
+Scenarios
+---------
+many_small_lots
+                Mostly small purchases, every sale consumes many batches.
+few_huge_lots
+                A few very large purchases, consumed by many small sales.
+same_day
+                Purchases and sales interleaved on the same days, which exercises the same date rules.
+multi_sku
+                A hundred items valued together by fifo.MultiInventory, and by fifo.value_in_parallel
+                on a pool of --workers processes. The speedup of value_in_parallel is measured against
+                value_serially, the same cogs, leftover inventory and sales revenue from MultiInventory.
+
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterator
+import argparse
+import datetime as dt
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from fifo import Inventory, MultiInventory, TransactionBatch, value_in_parallel
+
+SIZES = tuple(10**x for x in range(2, 8))
+DEFAULT_SIZES = tuple(10**x for x in range(2, 6))
+SCHEMA_VERSION = 1
+# below these, a difference is noise rather than a regression
+NOISE_FLOOR = {"seconds": 0.001, "peak_bytes": 1 << 16}
+
+
+def _generate(
+    size: int,
+    seed: int,
+    purchase_share: float,
+    purchase_quantity: Callable[[random.Random], int],
+    sale_share_of_on_hand: float,
+    transactions_per_day: int,
+    sku_count: int = 0,
+) -> tuple[TransactionBatch, TransactionBatch]:
+    """size transactions in date order, never selling more than is on hand of each item."""
+    rng = random.Random(seed)
+    first_date = dt.date(2000, 1, 1)
+    skus = [f"sku-{x}" for x in range(sku_count)] or [None]
+    on_hand = dict.fromkeys(skus, 0)
+    columns = {
+        classification: ([], [], [], []) for classification in ("purchases", "sales")
+    }
+    dates = {}
+    for position in range(size):
+        day = position // transactions_per_day
+        if day not in dates:
+            dates[day] = first_date + dt.timedelta(days=day)
+        sku = rng.choice(skus)
+        if on_hand[sku] == 0 or rng.random() < purchase_share:
+            classification = "purchases"
+            quantity = purchase_quantity(rng)
+            unit_price = rng.randrange(100, 1000) / 100
+            on_hand[sku] += quantity
+        else:
+            classification = "sales"
+            quantity = rng.randint(1, max(1, int(on_hand[sku] * sale_share_of_on_hand)))
+            unit_price = rng.randrange(1000, 2000) / 100
+            on_hand[sku] -= quantity
+        column_dates, quantities, unit_prices, column_skus = columns[classification]
+        column_dates.append(dates[day])
+        quantities.append(quantity)
+        unit_prices.append(unit_price)
+        column_skus.append(sku)
+    return tuple(
+        TransactionBatch.from_columns(
+            classification,
+            column_dates,
+            quantities,
+            unit_prices,
+            column_skus if sku_count else None,
+        )
+        for classification, (column_dates, quantities, unit_prices, column_skus) in columns.items()
+    )
+
+
+def many_small_lots(size: int, seed: int = 0) -> tuple[TransactionBatch, TransactionBatch]:
+    return _generate(size, seed, 0.8, lambda rng: rng.randint(1, 3), 0.5, 100)
+
+
+def few_huge_lots(size: int, seed: int = 0) -> tuple[TransactionBatch, TransactionBatch]:
+    return _generate(size, seed, 0.001, lambda rng: 10**6, 0.00001, 100)
+
+
+def same_day(size: int, seed: int = 0) -> tuple[TransactionBatch, TransactionBatch]:
+    return _generate(size, seed, 0.5, lambda rng: rng.randint(1, 20), 0.3, 10_000)
+
+
+def multi_sku(size: int, seed: int = 0) -> tuple[TransactionBatch, TransactionBatch]:
+    return _generate(size, seed, 0.5, lambda rng: rng.randint(1, 20), 0.3, 100, sku_count=100)
+
+
+SCENARIOS = {
+    "many_small_lots": many_small_lots,
+    "few_huge_lots": few_huge_lots,
+    "same_day": same_day,
+    "multi_sku": multi_sku,
+}
+
+
+def _value_serially(purchases: TransactionBatch, sales: TransactionBatch) -> tuple:
+    """The results of value_in_parallel, computed by MultiInventory in this process."""
+    multi = MultiInventory(purchases, sales)
+    return multi.cogs(), multi.sales_revenue(), multi.leftover_inventory()
+
+
+def operations(
+    scenario: str,
+    purchases: TransactionBatch,
+    sales: TransactionBatch,
+    executor: Executor | None = None,
+) -> dict[str, Callable[[], object]]:
+    """The timed operations, each starts from a new Inventory so nothing cached is reused.
+
+    value_in_parallel reuses executor, so starting the processes is not timed.
+    """
+    if scenario == "multi_sku":
+        return {
+            "construction": lambda: MultiInventory(purchases, sales),
+            "cogs": lambda: MultiInventory(purchases, sales).cogs(),
+            "leftover_inventory": lambda: MultiInventory(purchases, sales).leftover_inventory(),
+            "sales_revenue": lambda: MultiInventory(purchases, sales).sales_revenue(),
+            "value_serially": lambda: _value_serially(purchases, sales),
+            "value_in_parallel": lambda: value_in_parallel(purchases, sales, executor=executor),
+        }
+    return {
+        "construction": lambda: Inventory(purchases, sales),
+        "cogs_inventory": lambda: Inventory(purchases, sales).cogs_inventory(),
+        "cogs": lambda: Inventory(purchases, sales).cogs(),
+        "leftover_inventory": lambda: Inventory(purchases, sales).leftover_inventory(),
+        "sales_revenue": lambda: Inventory(purchases, sales).sales_revenue(),
+        "cogs_money": lambda: Inventory(purchases, sales, price_scale=100).cogs(),
+    }
+
+
+def best_time(calculation: Callable[[], object], repeat: int) -> float:
+    """The fastest of repeat runs in seconds, the slower runs are noise from the machine."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        calculation()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(calculation: Callable[[], object]) -> int:
+    """Peak traced memory in bytes while running calculation, including what it keeps alive."""
+    tracemalloc.start()
+    try:
+        result = calculation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def run(
+    scenarios: list[str],
+    sizes: list[int],
+    repeat: int,
+    memory: bool = True,
+    workers: int | None = None,
+) -> Iterator[dict]:
+    """Yields one result per scenario, size and operation.
+
+    The result of value_in_parallel also holds its speedup over value_serially,
+    peak_bytes only covers this process and not the workers.
+    """
+    # the processes are only started by the first value_in_parallel
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for scenario in scenarios:
+            for size in sizes:
+                purchases, sales = SCENARIOS[scenario](size)
+                # a single run of the largest ledgers already takes long enough to be steady
+                size_repeat = repeat if size < 10**6 else 1
+                seconds = {}
+                for operation, calculation in operations(scenario, purchases, sales, pool).items():
+                    seconds[operation] = best_time(calculation, size_repeat)
+                    result = {
+                        "scenario": scenario,
+                        "size": size,
+                        "operation": operation,
+                        "seconds": seconds[operation],
+                        "peak_bytes": peak_memory(calculation) if memory else None,
+                    }
+                    if operation == "value_in_parallel":
+                        result["speedup"] = seconds["value_serially"] / seconds[operation]
+                    yield result
+
+
+def regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Describes every timing or peak memory that grew by more than the tolerance over the baseline."""
+    previous = {(x["scenario"], x["size"], x["operation"]): x for x in baseline}
+    found = []
+    for result in results:
+        key = (result["scenario"], result["size"], result["operation"])
+        if key not in previous:
+            continue
+        for measure in ("seconds", "peak_bytes"):
+            before, after = previous[key].get(measure), result[measure]
+            if before is None or after is None or after < NOISE_FLOOR[measure]:
+                continue
+            if after > before * (1 + tolerance):
+                found.append(f"{'/'.join(map(str, key))} {measure}: {before} -> {after}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times fifo.Inventory on generated ledgers.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_SIZES),
+        help=f"transactions per ledger, up to {SIZES[-1]:.0e} (default: 1e2 to 1e5)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes of value_in_parallel (default: the number of processors)",
+    )
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="fail when slower than the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    arguments = parser.parse_args()
+
+    results = []
+    for result in run(
+        arguments.scenarios,
+        arguments.sizes,
+        arguments.repeat,
+        not arguments.no_memory,
+        arguments.workers,
+    ):
+        results.append(result)
+        peak = "" if result["peak_bytes"] is None else f"{result['peak_bytes'] / 2**20:10.1f} MiB"
+        speedup = f" {result['speedup']:6.2f}x" if "speedup" in result else ""
+        print(
+            f"{result['scenario']:>16} {result['size']:>9} {result['operation']:>18}"
+            f" {result['seconds']:10.4f} s {peak}{speedup}"
+        )
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(
+                {
+                    "schema_version": SCHEMA_VERSION,
+                    "created": dt.datetime.now(dt.timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                file,
+                indent=1,
+            )
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)["results"]
+        found = regressions(results, baseline, arguments.tolerance)
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
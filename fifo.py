@@ -17,12 +17,28 @@ You may import this file by using the following import::
 
 """
 
-from attrs import frozen, field, define, setters
-from attrs.validators import instance_of
-from typing import ClassVar, Iterator, List, Tuple
+from attrs import frozen, field, fields, define, setters
+from attrs.validators import gt, in_, instance_of, optional
+from typing import Callable, ClassVar, Iterable, Iterator, List, Sequence, Tuple
 import itertools
 import datetime as dt
-import copy
+import bisect
+import functools
+import heapq
+import operator
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only Inventory.cogs_vectorized needs it
+    np = None
 
 def date_converter(date: str | dt.date) -> dt.date:
     """
@@ -41,12 +57,111 @@ def date_converter(date: str | dt.date) -> dt.date:
                     Ensure that both string and datetime format is allowed
     """
     if isinstance(date, str):
-        return dt.date.fromisoformat(date)
+        return _parse_iso_date(date)
     elif isinstance(date, dt.date):
-        return date
+        return _interned_date(date)
 
 
-@define(order=True)
+@functools.lru_cache(maxsize=1 << 16)
+def _interned_date(date: dt.date) -> dt.date:
+    """Equal dates share one object, a ledger only has a few distinct dates."""
+    return date
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _parse_iso_date(date: str) -> dt.date:
+    return _interned_date(dt.date.fromisoformat(date))
+
+
+class SequenceAllocator:
+    """
+    Hands out increasing indices, safe to share between threads.
+
+    A single index is drawn with next(), a contiguous block of indices
+    for a whole batch with allocate(), both under one short lock.
+
+    Parameters
+    ----------
+    start
+                    The first index handed out.
+    """
+
+    def __init__(self, start: int = 0):
+        self._next = start
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._next})"
+
+    def __iter__(self) -> "SequenceAllocator":
+        return self
+
+    def __next__(self) -> int:
+        with self._lock:
+            index = self._next
+            self._next += 1
+        return index
+
+    def allocate(self, count: int) -> range:
+        """Reserves count consecutive indices at once."""
+        if count < 0:
+            raise ValueError("count must not be negative")
+        with self._lock:
+            start = self._next
+            self._next += count
+        return range(start, start + count)
+
+    def peek(self) -> int:
+        """The index the next transaction will get, without using it up."""
+        return self._next
+
+    def advance_to(self, start: int) -> None:
+        """Makes sure no index below start is handed out from now on, an allocator never goes back."""
+        with self._lock:
+            self._next = max(self._next, start)
+
+
+@define(weakref_slot=False)
+class LedgerSequences:
+    """
+    The purchase and sales indices of one ledger, kept apart from every other ledger.
+
+    While active, Purchases, Sales and TransactionBatch.from_columns draw their indices
+    from these allocators instead of Purchases.index_global and Sales.index_global.
+    Being active is local to the thread or asyncio task, so ledgers built
+    side by side get the same indices whichever runs first::
+
+        >>> with LedgerSequences().active():
+        ...     p0 = Purchases("2024-05-01", 20, 3)  # index 0, whatever was created before
+
+    """
+
+    purchases: SequenceAllocator = field(factory=SequenceAllocator)
+    sales: SequenceAllocator = field(factory=SequenceAllocator)
+
+    @contextlib.contextmanager
+    def active(self) -> Iterator["LedgerSequences"]:
+        token = _active_sequences.set(self)
+        try:
+            yield self
+        finally:
+            _active_sequences.reset(token)
+
+
+_active_sequences: contextvars.ContextVar[LedgerSequences | None] = contextvars.ContextVar(
+    "active_sequences", default=None
+)
+
+
+def _index_allocator(classification: str) -> SequenceAllocator:
+    """The allocator new transactions of a classification draw their indices from."""
+    sequences = _active_sequences.get()
+    if classification == "sales":
+        return Sales.index_global if sequences is None else sequences.sales
+    return Purchases.index_global if sequences is None else sequences.purchases
+
+
+@define(order=True, weakref_slot=False)
 class Purchases:
     """Keeping track of the purchases done, the beginning inventory is named p0, the first object.
 
@@ -61,12 +176,15 @@ class Purchases:
                     Its purpose is to arrange the transactions in order, the absolute date does not matter.
     classification
                     purchaases or sales, enable distinctions even after the class is imported.
+    sku
+                    Optional item identifier, only used by MultiInventory to keep different items apart.
     index
                     A unique index given to all objects, it will be generated automatically.
     index_global
                     To keep track of the indexes of each object created.\n
                     Purchase — batch no.\n
-                    Sales — order no.
+                    Sales — order no.\n
+                    A SequenceAllocator, unless a LedgerSequences is active.
 
     """
 
@@ -75,11 +193,14 @@ class Purchases:
     unit_price: float = field(
         validator=instance_of(int | float), on_setattr=setters.frozen
     )
+    sku: str | None = field(
+        default=None, validator=optional(instance_of(str)), on_setattr=setters.frozen
+    )
     classification: ClassVar[str] = field(
         init=False, default="purchases", on_setattr=setters.frozen
     )
     index: int = field(init=False)
-    index_global: ClassVar[Iterator[int]] = itertools.count()
+    index_global: ClassVar[SequenceAllocator] = SequenceAllocator()
 
     @quantity.validator
     @unit_price.validator
@@ -88,19 +209,29 @@ class Purchases:
             raise ValueError
 
     @classmethod
-    def _reset_index(cls) -> None:
-        cls.index_global = itertools.count()
+    def _reset_index(cls, start: int = 0) -> None:
+        cls.index_global = SequenceAllocator(start)
 
     @property
     def total_value(self) -> float:
         """Total price of each order"""
         return self.quantity * self.unit_price
 
+    def total_value_minor(self, price_scale: int) -> int:
+        """Exact total price of each order in minor units, such as cents with a price_scale of 100.
+
+        Raises
+        ------
+        ValueError
+                        When the unit price is not a whole number of minor units.
+        """
+        return self.quantity * _minor_units([self.unit_price], price_scale)[0]
+
     def __attrs_post_init__(self):
-        self.index = next(Purchases.index_global)
+        self.index = next(_index_allocator(self.classification))
 
 
-@define(order=True)
+@define(order=True, weakref_slot=False)
 class Sales(Purchases):
     """
     Inherited from Purchases, the only thing different is the classification and index no.
@@ -111,16 +242,846 @@ class Sales(Purchases):
     classification: ClassVar[str] = field(
         init=False, default="sales", on_setattr=setters.frozen
     )
-    index_global: ClassVar[Iterator[int]] = itertools.count()
+    index_global: ClassVar[SequenceAllocator] = SequenceAllocator()
 
-    def __attrs_post_init__(self):
-        self.index = next(Sales.index_global)
+
+@frozen
+class OversoldSale:
+    """A sale that is larger than the inventory on hand at its date.
+
+    Attributes
+    ----------
+    index
+                    The order no. of the sale.
+    date_iso
+                    The date of the sale.
+    shortfall
+                    How much the sale must be reduced by, after every earlier oversold sale
+                    was reduced by its own shortfall, to be filled.
+    sku
+                    The item of the sale.
+    """
+
+    index: int
+    date_iso: dt.date
+    shortfall: int
+    sku: str | None = None
 
 
 class SalesMoreThanInventoryError(Exception):
-    """Exception handling. Ensure that all sales are possible, sales cannot occur if inventory has less to provide."""
+    """Exception handling. Ensure that all sales are possible, sales cannot occur if inventory has less to provide.
+
+    Attributes
+    ----------
+    oversold : tuple[OversoldSale, ...]
+                    Every sale that cannot be filled, in date order, when they are known.
+                    Reducing each of them by its shortfall makes all sales possible.
+    """
+
+    def __init__(self, *args, oversold: Iterable[OversoldSale] = ()):
+        self.oversold = tuple(oversold)
+        if not args and self.oversold:
+            first = self.oversold[0]
+            args = (
+                f"{len(self.oversold)} sales are larger than the inventory on hand, "
+                f"the first is order no. {first.index} on {first.date_iso.isoformat()}, "
+                f"short by {first.shortfall}",
+            )
+        super().__init__(*args)
+
+
+@frozen(weakref_slot=False)
+class Consumption:
+    """A lightweight record of how much of a purchase batch was taken by a sales order.
+
+    Attributes
+    ----------
+    sales_index
+                    The order no. of the sale that consumed the batch.
+    purchase_index
+                    The batch no. of the purchase being consumed.
+    date_iso
+                    The date of the purchase batch.
+    quantity
+                    Units taken from the batch.
+    unit_price
+                    The unit cost of the purchase batch.
+    """
+
+    sales_index: int
+    purchase_index: int
+    date_iso: dt.date
+    quantity: int
+    unit_price: float
+
+    @property
+    def total_value(self) -> float:
+        """Cost of the units taken from the batch"""
+        return self.quantity * self.unit_price
+
+
+_TRANSACTION_SLOTS = tuple(attribute.name for attribute in fields(Purchases))
+
+
+def _with_quantity(transaction: Purchases, quantity: int) -> Purchases:
+    """Clone a transaction with another quantity, keeping its index.
+
+    The clone is made without deepcopy and without calling __init__,
+    so no new index is drawn from index_global. The quantity is not validated again.
+    """
+    clone = object.__new__(type(transaction))
+    for name in _TRANSACTION_SLOTS:
+        object.__setattr__(clone, name, getattr(transaction, name))
+    object.__setattr__(clone, "quantity", quantity)
+    return clone
+
+
+def _transaction(
+    classification: str,
+    date_iso: dt.date,
+    quantity: int,
+    unit_price: float,
+    sku: str | None,
+    index: int,
+) -> Purchases:
+    """A Purchases or Sales with a known index, for rows that were validated when they were stored."""
+    transaction = object.__new__(Sales if classification == "sales" else Purchases)
+    object.__setattr__(transaction, "date_iso", date_iso)
+    object.__setattr__(transaction, "quantity", quantity)
+    object.__setattr__(transaction, "unit_price", unit_price)
+    object.__setattr__(transaction, "sku", sku)
+    object.__setattr__(transaction, "classification", classification)
+    object.__setattr__(transaction, "index", index)
+    return transaction
+
+
+def _minor_units(unit_prices: Sequence[float], price_scale: int) -> array:
+    """Unit prices as whole minor units, each must be exactly representable at the scale.
+
+    A price is accepted when it is the float nearest to a whole number of minor units,
+    3.55 is 355 cents but 3.555 is not a whole number of cents.
+    """
+    if np is not None:
+        prices = np.asarray(unit_prices, dtype=np.float64)
+        scaled = np.rint(prices * price_scale)
+        exact = bool(np.array_equal(scaled / price_scale, prices))
+        minor_units = array("q", scaled.astype(np.int64).tobytes())
+    else:
+        minor_units = array("q", [round(x * price_scale) for x in unit_prices])
+        exact = all(
+            map(
+                operator.eq,
+                map(operator.truediv, minor_units, itertools.repeat(price_scale)),
+                unit_prices,
+            )
+        )
+    if not exact:
+        for price, units in zip(unit_prices, minor_units):
+            if units / price_scale != price:
+                raise ValueError(f"{price!r} is not a whole number of 1/{price_scale}")
+    return minor_units
+
+
+class _DateOrdinals(dict):
+    """Maps dates, iso strings or datetime.date, to ordinals and parses each distinct date once."""
 
-    pass
+    def __missing__(self, date: str | dt.date) -> int:
+        converted = date_converter(date)
+        if converted is None:
+            raise TypeError(f"{date!r} is not a date")
+        ordinal = self[date] = converted.toordinal()
+        return ordinal
+
+
+def _date_ordinals(dates: Iterable[str | dt.date]) -> array:
+    """Convert a column of dates to ordinals, every distinct date is only parsed once."""
+    return array("l", map(_DateOrdinals().__getitem__, dates))
+
+
+@define
+class TransactionBatch:
+    """Many purchases or many sales stored column by column.
+
+    Holds the same information as a list of Purchases or Sales in a few compact arrays,
+    so large ledgers can be loaded and valued by Inventory without creating an object per row.
+    Indexing or iterating a batch gives Purchases or Sales as a view of one row.
+
+    Attributes
+    ----------
+    classification
+                    purchases or sales, every row of a batch has the same classification.
+    dates
+                    The dates as proleptic Gregorian ordinals, see datetime.date.toordinal.
+    quantities
+                    The quantity of every row.
+    unit_prices
+                    The unit cost or price of every row.
+    indices
+                    The batch no. or order no. of every row.
+    skus
+                    Optional item identifier of every row.
+
+    Notes
+    -----
+    Use from_columns to build a batch from dates, quantities and prices,
+    the indices are then drawn from Purchases.index_global or Sales.index_global,
+    or the active LedgerSequences, as one contiguous block.
+
+    """
+
+    classification: str = field(validator=in_(("purchases", "sales")))
+    dates: array = field(converter=lambda x: array("l", x))
+    quantities: array = field(converter=lambda x: array("q", x))
+    unit_prices: array = field(converter=lambda x: array("d", x))
+    indices: array = field(converter=lambda x: array("q", x))
+    skus: list[str | None] | None = field(default=None)
+
+    def __attrs_post_init__(self):
+        # validated column by column instead of row by row
+        row_count = len(self.dates)
+        columns = [self.quantities, self.unit_prices, self.indices]
+        if self.skus is not None:
+            columns.append(self.skus)
+        if any(len(column) != row_count for column in columns):
+            raise ValueError("All columns must have the same length")
+        for name, column in (("quantity", self.quantities), ("unit_price", self.unit_prices)):
+            if row_count and min(column) < 0:
+                position = next(x for x, value in enumerate(column) if value < 0)
+                raise ValueError(f"Row {position} has a negative {name} {column[position]!r}")
+
+    @classmethod
+    def from_columns(
+        cls,
+        classification: str,
+        dates: Iterable[str | dt.date],
+        quantities: Iterable[int],
+        unit_prices: Iterable[float],
+        skus: Iterable[str | None] | None = None,
+    ) -> "TransactionBatch":
+        """Builds a batch from columns, dates in iso format "yyyy-MM-dd" or datetime.date are allowed."""
+        ordinals = _date_ordinals(dates)
+        return cls(
+            classification,
+            ordinals,
+            quantities,
+            unit_prices,
+            _index_allocator(classification).allocate(len(ordinals)),
+            None if skus is None else list(skus),
+        )
+
+    @classmethod
+    def from_transactions(
+        cls, classification: str, transactions: Iterable[Purchases]
+    ) -> "TransactionBatch":
+        """Builds a batch from existing Purchases or Sales, keeping their indices."""
+        transactions = list(transactions)
+        skus = [x.sku for x in transactions]
+        return cls(
+            classification,
+            _date_ordinals(x.date_iso for x in transactions),
+            [x.quantity for x in transactions],
+            [x.unit_price for x in transactions],
+            [x.index for x in transactions],
+            None if all(sku is None for sku in skus) else skus,
+        )
+
+    @classmethod
+    def concatenate(
+        cls, classification: str, batches: Iterable["TransactionBatch"]
+    ) -> "TransactionBatch":
+        """One batch with the rows of all batches, one after another, keeping their indices."""
+        batches = list(batches)
+        if any(batch.classification != classification for batch in batches):
+            raise ValueError(f"All batches must hold {classification}")
+        dates, quantities, unit_prices, indices = array("l"), array("q"), array("d"), array("q")
+        skus = None
+        if any(batch.skus is not None for batch in batches):
+            skus = []
+        for batch in batches:
+            dates.extend(batch.dates)
+            quantities.extend(batch.quantities)
+            unit_prices.extend(batch.unit_prices)
+            indices.extend(batch.indices)
+            if skus is not None:
+                skus.extend(batch.skus or itertools.repeat(None, len(batch)))
+        return cls(classification, dates, quantities, unit_prices, indices, skus)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, position: int) -> Purchases:
+        return _transaction(
+            self.classification,
+            dt.date.fromordinal(self.dates[position]),
+            self.quantities[position],
+            self.unit_prices[position],
+            None if self.skus is None else self.skus[position],
+            self.indices[position],
+        )
+
+    def __iter__(self) -> Iterator[Purchases]:
+        return (self[position] for position in range(len(self)))
+
+    def take(self, positions: Sequence[int]) -> "TransactionBatch":
+        """A new batch with the rows at the given positions, in that order."""
+        return TransactionBatch(
+            self.classification,
+            array("l", [self.dates[x] for x in positions]),
+            array("q", [self.quantities[x] for x in positions]),
+            array("d", [self.unit_prices[x] for x in positions]),
+            array("q", [self.indices[x] for x in positions]),
+            None if self.skus is None else [self.skus[x] for x in positions],
+        )
+
+    def sorted(self) -> "TransactionBatch":
+        """The batch sorted by date and index, like Inventory.purchase_list_sorted.
+
+        A batch that is already in order is returned as it is.
+        """
+        dates, indices = self.dates, self.indices
+        keys = list(zip(dates, indices))
+        if all(itertools.starmap(operator.le, itertools.pairwise(keys))):
+            return self
+        return self.take(sorted(range(len(self)), key=keys.__getitem__))
+
+
+@frozen
+class FifoResult:
+    """The outcome of matching an Inventory, computed once and shared by all of its accessors.
+
+    Only the totals and the slices, as compact (sale, batch, quantity) columns, are kept,
+    the records and Purchases below are built on first access.
+
+    Attributes
+    ----------
+    cogs
+                    Total cost of goods sold.
+    sales_revenue
+                    Total sales revenue.
+    consumption
+                    The slices taken from each purchase batch by each sale.
+    cogs_list
+                    The slices as Purchases, in the same form as cogs_inventory.
+    leftover_inventory
+                    The batches with inventory left after all sales.
+    valuation_index
+                    Prefix sums over the sales and purchases, for date range queries.
+    cogs_minor
+                    Exact total cost of goods sold in minor units, None unless a price scale was given.
+    sales_revenue_minor
+                    Exact total sales revenue in minor units, None unless a price scale was given.
+    stats
+                    Timings and counters of the matching, None unless Inventory collected them.
+    """
+
+    cogs: float
+    sales_revenue: float
+    _purchase_list: Sequence[Purchases] = field(repr=False)
+    _sales_list: Sequence[Sales] = field(repr=False)
+    _slices: Tuple[array, array, array] = field(repr=False)
+    _remaining: array = field(repr=False)
+    _oldest: int = field(repr=False)
+    cogs_minor: int | None = None
+    sales_revenue_minor: int | None = None
+    stats: "ValuationStats | None" = field(default=None, eq=False, repr=False)
+    _built: dict[str, object] = field(init=False, factory=dict, eq=False, repr=False)
+
+    @property
+    def consumption(self) -> tuple[Consumption, ...]:
+        if "consumption" not in self._built:
+            records = []
+            for sales_position, purchase_position, quantity in zip(*self._slices):
+                batch = self._purchase_list[purchase_position]
+                records.append(
+                    Consumption(
+                        self._sales_list[sales_position].index,
+                        batch.index,
+                        batch.date_iso,
+                        quantity,
+                        batch.unit_price,
+                    )
+                )
+            self._built["consumption"] = tuple(records)
+        return self._built["consumption"]
+
+    @property
+    def cogs_list(self) -> tuple[Purchases, ...]:
+        if "cogs_list" not in self._built:
+            cogs_list = []
+            # the original matching kept a used up batch at the head until the next sale,
+            # which then listed it, like every empty batch it passed, with quantity 0
+            head = 0
+            for _, sales_slices in itertools.groupby(
+                zip(*self._slices), key=operator.itemgetter(0)
+            ):
+                taken = {position: quantity for _, position, quantity in sales_slices}
+                last = max(taken)
+                for position in range(head, last + 1):
+                    cogs_list.append(
+                        _with_quantity(self._purchase_list[position], taken.get(position, 0))
+                    )
+                head = last
+            self._built["cogs_list"] = tuple(cogs_list)
+        return self._built["cogs_list"]
+
+    @property
+    def leftover_inventory(self) -> tuple[Purchases, ...]:
+        if "leftover_inventory" not in self._built:
+            self._built["leftover_inventory"] = tuple(
+                _with_quantity(self._purchase_list[position], self._remaining[position])
+                for position in range(self._oldest, len(self._remaining))
+                if self._remaining[position] != 0
+            )
+        return self._built["leftover_inventory"]
+
+    @property
+    def valuation_index(self) -> "ValuationIndex":
+        if "valuation_index" not in self._built:
+            self._built["valuation_index"] = ValuationIndex.build(
+                self._purchase_list, self._sales_list, self._slices
+            )
+        return self._built["valuation_index"]
+
+
+@frozen
+class ValuationIndex:
+    """Answers date range and as of queries on a matched Inventory in O(log n).
+
+    The sales and purchases are kept in first in first out order with their date ordinals,
+    next to running totals, so a query is two binary searches and a subtraction.
+    Every date is inclusive and the amounts as of a date are taken at the end of that day.
+
+    Attributes
+    ----------
+    sales_dates
+                    The date ordinal of every sale, in first in first out order.
+    cogs_totals
+                    The cost of goods sold of the sales before each position.
+    revenue_totals
+                    The revenue of the sales before each position.
+    sold_totals
+                    The quantity of the sales before each position.
+    purchase_dates
+                    The date ordinal of every purchase, in first in first out order.
+    bought_totals
+                    The quantity of the purchases before each position.
+    cost_totals
+                    The cost of the purchases before each position.
+    """
+
+    sales_dates: array = field(repr=False)
+    cogs_totals: array = field(repr=False)
+    revenue_totals: array = field(repr=False)
+    sold_totals: array = field(repr=False)
+    purchase_dates: array = field(repr=False)
+    bought_totals: array = field(repr=False)
+    cost_totals: array = field(repr=False)
+
+    @classmethod
+    def build(
+        cls,
+        purchase_list: Sequence[Purchases],
+        sales_list: Sequence[Sales],
+        slices: Tuple[array, array, array],
+    ) -> "ValuationIndex":
+        """Builds the running totals from sorted purchases and sales and the slices matching them."""
+        purchase_dates, purchase_quantities, purchase_prices = _columns(purchase_list)
+        sales_dates, sales_quantities, sales_prices = _columns(sales_list)
+        # the cost of every sale, summed over its slices
+        sales_cogs = array("d", bytes(8 * len(sales_dates)))
+        for sales_position, purchase_position, quantity in zip(*slices):
+            sales_cogs[sales_position] += quantity * purchase_prices[purchase_position]
+        return cls(
+            sales_dates,
+            array("d", itertools.accumulate(sales_cogs, initial=0.0)),
+            array(
+                "d",
+                itertools.accumulate(
+                    map(operator.mul, sales_quantities, sales_prices), initial=0.0
+                ),
+            ),
+            array("q", itertools.accumulate(sales_quantities, initial=0)),
+            purchase_dates,
+            array("q", itertools.accumulate(purchase_quantities, initial=0)),
+            array(
+                "d",
+                itertools.accumulate(
+                    map(operator.mul, purchase_quantities, purchase_prices), initial=0.0
+                ),
+            ),
+        )
+
+    def _sales_between(self, start: str | dt.date, end: str | dt.date) -> Tuple[int, int]:
+        return (
+            bisect.bisect_left(self.sales_dates, date_converter(start).toordinal()),
+            bisect.bisect_right(self.sales_dates, date_converter(end).toordinal()),
+        )
+
+    def cogs_between(self, start: str | dt.date, end: str | dt.date) -> float:
+        """The cost of goods sold by the sales from start to end."""
+        first, stop = self._sales_between(start, end)
+        return self.cogs_totals[max(first, stop)] - self.cogs_totals[first]
+
+    def revenue_between(self, start: str | dt.date, end: str | dt.date) -> float:
+        """The revenue of the sales from start to end."""
+        first, stop = self._sales_between(start, end)
+        return self.revenue_totals[max(first, stop)] - self.revenue_totals[first]
+
+    def on_hand_as_of(self, date: str | dt.date) -> int:
+        """The quantity in inventory at the end of the day."""
+        ordinal = date_converter(date).toordinal()
+        return (
+            self.bought_totals[bisect.bisect_right(self.purchase_dates, ordinal)]
+            - self.sold_totals[bisect.bisect_right(self.sales_dates, ordinal)]
+        )
+
+    def inventory_value_as_of(self, date: str | dt.date) -> float:
+        """The cost of the inventory at the end of the day."""
+        ordinal = date_converter(date).toordinal()
+        return (
+            self.cost_totals[bisect.bisect_right(self.purchase_dates, ordinal)]
+            - self.cogs_totals[bisect.bisect_right(self.sales_dates, ordinal)]
+        )
+
+
+@define
+class ValuationStats:
+    """Where the matching of an Inventory spent its time, collected when Inventory is asked to.
+
+    Attributes
+    ----------
+    sort_seconds
+                    Sorting the purchases and sales by date and index.
+    copy_seconds
+                    Copying dates and quantities into the columns the matching runs on.
+    check_seconds
+                    Checking that no sale is larger than the inventory on hand, before the matching.
+    match_seconds
+                    Matching the sales against the batches.
+    value_seconds
+                    Adding up the cost of goods sold of the slices.
+    sales_checked
+                    Sales checked against the inventory on hand.
+    slices
+                    Slices taken from the batches.
+    lots_consumed
+                    Batches that were used up.
+    partial_splits
+                    Slices that left inventory in their batch.
+    """
+
+    sort_seconds: float = 0.0
+    copy_seconds: float = 0.0
+    check_seconds: float = 0.0
+    match_seconds: float = 0.0
+    value_seconds: float = 0.0
+    sales_checked: int = 0
+    slices: int = 0
+    lots_consumed: int = 0
+    partial_splits: int = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return (
+            self.sort_seconds
+            + self.copy_seconds
+            + self.check_seconds
+            + self.match_seconds
+            + self.value_seconds
+        )
+
+    def count(
+        self, sales_count: int, slices: Tuple[array, array, array], remaining: array
+    ) -> None:
+        """Adds the counters of one matching, from its slices and the quantities left."""
+        _, purchase_positions, _ = slices
+        # every used up batch ends with exactly one slice that took all that was left
+        used_up = sum(1 for position in set(purchase_positions) if remaining[position] == 0)
+        self.sales_checked += sales_count
+        self.slices += len(purchase_positions)
+        self.lots_consumed += used_up
+        self.partial_splits += len(purchase_positions) - used_up
+
+
+@define
+class CacheStats:
+    """Counts how often the cached FifoResult of an Inventory was reused (hits) or calculated (misses)."""
+
+    hits: int = 0
+    misses: int = 0
+
+
+def _oversold_positions(
+    purchase_dates: Sequence[dt.date | int],
+    purchase_quantities: Sequence[int],
+    sales_dates: Sequence[dt.date | int],
+    sales_quantities: Sequence[int],
+) -> list[Tuple[int, int]]:
+    """The position and shortfall of every sale larger than the inventory on hand, before any matching.
+
+    The quantity purchased up to each sale's date minus the quantity sold up to and including
+    the sale only drops below its lowest point so far at an oversold sale, by that sale's shortfall.
+    Takes O(n log n) for the binary searches, vectorized with numpy when it is installed.
+    """
+    if np is not None:
+        purchased = np.concatenate(
+            ([0], np.cumsum(np.asarray(purchase_quantities, dtype=np.int64)))
+        )
+        # purchases on the same date as a sale are available to it
+        arrived = np.searchsorted(
+            _ordinal_column(purchase_dates), _ordinal_column(sales_dates), side="right"
+        )
+        net = purchased[arrived] - np.cumsum(np.asarray(sales_quantities, dtype=np.int64))
+        lowest = np.minimum.accumulate(np.minimum(net, 0))
+        shortfalls = -np.diff(lowest, prepend=0)
+        positions = np.flatnonzero(shortfalls)
+        return list(zip(positions.tolist(), shortfalls[positions].tolist()))
+
+    purchased = list(itertools.accumulate(purchase_quantities, initial=0))
+    available = [purchased[bisect.bisect_right(purchase_dates, x)] for x in sales_dates]
+    net = map(operator.sub, available, itertools.accumulate(sales_quantities))
+    lowest = list(itertools.accumulate(net, min, initial=0))
+    return [
+        (position, shortfall)
+        for position, shortfall in enumerate(map(operator.sub, lowest, lowest[1:]))
+        if shortfall
+    ]
+
+
+def _ordinal_column(dates: Sequence[dt.date | int]):
+    """Dates or date ordinals as a numpy array of ordinals."""
+    if isinstance(dates, (array, np.ndarray)) or not dates or isinstance(dates[0], int):
+        return np.asarray(dates, dtype=np.int64)
+    return np.fromiter(map(dt.date.toordinal, dates), np.int64, len(dates))
+
+
+def _oversold_error(
+    sales_list: Sequence[Sales], positions: list[Tuple[int, int]]
+) -> SalesMoreThanInventoryError:
+    oversold = []
+    for position, shortfall in positions:
+        sale = sales_list[position]
+        oversold.append(OversoldSale(sale.index, sale.date_iso, shortfall, sale.sku))
+    return SalesMoreThanInventoryError(oversold=oversold)
+
+
+def _fifo_slices(
+    purchase_dates: Sequence[dt.date | int],
+    purchase_quantities: Sequence[int],
+    sales_dates: Sequence[dt.date | int],
+    sales_quantities: Sequence[int],
+) -> Tuple[Tuple[array, array, array], array, int]:
+    """Match sorted sales against sorted purchases with the first in first out method.
+
+    Works on plain columns, the transactions themselves are never touched.
+    A purchase made on the same date as a sale is available to that sale.
+
+    Returns
+    -------
+    slices : tuple[array, array, array]
+                    The sales position, purchase position and quantity of every slice taken, as three columns.
+                    A used up or empty batch is passed over, no slice has quantity 0.
+    remaining : array
+                    Quantity left in each purchase batch, a side array of purchase_quantities.
+    oldest : int
+                    Position of the oldest batch that may still hold inventory.
+
+    Raises
+    ------
+    SalesMoreThanInventoryError
+                    When a sale is larger than the inventory on hand at its date.
+    """
+    remaining = array("q", purchase_quantities)
+    slices = (array("q"), array("q"), array("q"))
+    add_sales_position, add_purchase_position, add_quantity = (
+        column.append for column in slices
+    )
+    purchase_count = len(remaining)
+    # purchases[oldest:arrived] are the open batches
+    oldest = arrived = 0
+    quantity_on_hand = 0
+
+    for sales_position, (sales_date, unfilled_quantity) in enumerate(
+        zip(sales_dates, sales_quantities)
+    ):
+        while arrived < purchase_count and purchase_dates[arrived] <= sales_date:
+            quantity_on_hand += remaining[arrived]
+            arrived += 1
+
+        if unfilled_quantity > quantity_on_hand:
+            raise SalesMoreThanInventoryError
+        quantity_on_hand -= unfilled_quantity
+
+        while unfilled_quantity:
+            position = oldest
+            available_quantity = remaining[position]
+            if unfilled_quantity >= available_quantity:
+                # the whole batch is transferred to the cogs account
+                remaining[position] = 0
+                oldest += 1
+                if not available_quantity:
+                    # nothing is taken from an empty batch
+                    continue
+                taken_quantity = available_quantity
+            else:
+                # part of the batch is transferred, the rest stays in inventory
+                remaining[position] = available_quantity - unfilled_quantity
+                taken_quantity = unfilled_quantity
+            add_sales_position(sales_position)
+            add_purchase_position(position)
+            add_quantity(taken_quantity)
+            unfilled_quantity -= taken_quantity
+
+    return slices, remaining, oldest
+
+
+def _fifo_result(
+    purchase_list: Sequence[Purchases],
+    sales_list: Sequence[Sales],
+    sales_revenue: float | int,
+    price_scale: int | None = None,
+    stats: "ValuationStats | None" = None,
+) -> FifoResult:
+    """Match sorted purchases and sales, given as lists or TransactionBatch, into a FifoResult.
+
+    With a price_scale, the sales revenue is given in minor units and the cost of goods sold
+    is added up exactly in minor units. With stats, the time of every step is added to it.
+    """
+    if stats is not None:
+        started = time.perf_counter()
+    if isinstance(purchase_list, TransactionBatch) and isinstance(
+        sales_list, TransactionBatch
+    ):
+        columns = (
+            purchase_list.dates,
+            purchase_list.quantities,
+            sales_list.dates,
+            sales_list.quantities,
+        )
+    else:
+        # ordinals compare faster than dates in the matching and need no conversion for numpy
+        columns = (
+            [x.date_iso.toordinal() for x in purchase_list],
+            [x.quantity for x in purchase_list],
+            [x.date_iso.toordinal() for x in sales_list],
+            [x.quantity for x in sales_list],
+        )
+    if stats is not None:
+        stats.copy_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+    oversold = _oversold_positions(*columns)
+    if oversold:
+        raise _oversold_error(sales_list, oversold)
+    if stats is not None:
+        stats.check_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+    slices, remaining, oldest = _fifo_slices(*columns)
+    if stats is not None:
+        stats.match_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+
+    if isinstance(purchase_list, TransactionBatch):
+        unit_prices = purchase_list.unit_prices
+    else:
+        unit_prices = [x.unit_price for x in purchase_list]
+    if price_scale is not None:
+        unit_prices = _minor_units(unit_prices, price_scale)
+
+    cogs = sum([quantity * unit_prices[position] for _, position, quantity in zip(*slices)])
+    if stats is not None:
+        stats.value_seconds += time.perf_counter() - started
+        stats.count(len(sales_list), slices, remaining)
+    if price_scale is None:
+        return FifoResult(
+            cogs=cogs,
+            sales_revenue=sales_revenue,
+            purchase_list=purchase_list,
+            sales_list=sales_list,
+            slices=slices,
+            remaining=remaining,
+            oldest=oldest,
+            stats=stats,
+        )
+    return FifoResult(
+        cogs=cogs / price_scale,
+        sales_revenue=sales_revenue / price_scale,
+        purchase_list=purchase_list,
+        sales_list=sales_list,
+        slices=slices,
+        remaining=remaining,
+        oldest=oldest,
+        cogs_minor=cogs,
+        sales_revenue_minor=sales_revenue,
+        stats=stats,
+    )
+
+
+def _sales_revenue(sales_list: Sequence[Sales], price_scale: int | None = None) -> float | int:
+    """The sales revenue, in minor units when a price_scale is given."""
+    if isinstance(sales_list, TransactionBatch):
+        quantities, unit_prices = sales_list.quantities, sales_list.unit_prices
+    else:
+        quantities = [x.quantity for x in sales_list]
+        unit_prices = [x.unit_price for x in sales_list]
+    if price_scale is not None:
+        unit_prices = _minor_units(unit_prices, price_scale)
+    return sum([q * p for q, p in zip(quantities, unit_prices)])
+
+
+@frozen
+class VectorizedCogs:
+    """The outcome of Inventory.cogs_vectorized.
+
+    Attributes
+    ----------
+    cogs
+                    Total cost of goods sold.
+    sales_cogs
+                    Cost of goods sold of every sale, in the order of Inventory.sales_list_sorted.
+    leftover_inventory
+                    The batches with inventory left after all sales.
+    """
+
+    cogs: float
+    sales_cogs: "np.ndarray" = field(eq=False)
+    leftover_inventory: tuple[Purchases, ...]
+
+
+def _numpy_columns(transactions: Sequence[Purchases]) -> tuple:
+    """Date ordinals, quantities and unit prices as numpy arrays."""
+    if isinstance(transactions, TransactionBatch):
+        return (
+            np.asarray(transactions.dates, dtype=np.int64),
+            np.asarray(transactions.quantities, dtype=np.int64),
+            np.asarray(transactions.unit_prices, dtype=np.float64),
+        )
+    count = len(transactions)
+    return (
+        np.fromiter((x.date_iso.toordinal() for x in transactions), np.int64, count),
+        np.fromiter((x.quantity for x in transactions), np.int64, count),
+        np.fromiter((x.unit_price for x in transactions), np.float64, count),
+    )
+
+
+def _as_transactions(
+    transactions: Iterable[Purchases] | TransactionBatch,
+) -> list[Purchases] | TransactionBatch:
+    if isinstance(transactions, TransactionBatch):
+        return transactions
+    return list(transactions)
+
+
+_date_and_index = operator.attrgetter("date_iso", "index")
+
+
+def _sorted_transactions(transactions: Sequence[Purchases]) -> Sequence[Purchases]:
+    """Transactions sorted by date and index, returned as they are when already in that order."""
+    if isinstance(transactions, TransactionBatch):
+        return transactions.sorted()
+    keys = list(map(_date_and_index, transactions))
+    if all(itertools.starmap(operator.le, itertools.pairwise(keys))):
+        return transactions
+    return [transactions[x] for x in sorted(range(len(keys)), key=keys.__getitem__)]
 
 
 @frozen
@@ -132,45 +1093,108 @@ class Inventory:
 
     Parameters
     ----------
-    purchase_list : list[Purchases]
+    purchase_list : list[Purchases] | TransactionBatch
                     List of all the inventory ins.
 
-    sales_list : list[Sales]
+    sales_list : list[Sales] | TransactionBatch
                     List of all the inventory outs
 
+    price_scale : int, optional
+                    Number of minor units in one unit of money, such as 100 for cents.
+                    When given, cogs and sales_revenue are added up exactly in minor units
+                    and only divided by the scale at the end. Every unit price must then be
+                    a whole number of minor units. Must be positive.
+
+    collect_stats : bool, optional
+                    When True, the matching is timed and counted into result.stats.
+    on_stats : Callable[[ValuationStats], None], optional
+                    Called with the stats once the matching is done, to hand them on to a metrics system.
+                    Giving it also collects the stats.
+
     Notes
     -----
-    The beginning purchase is the leftover inventory from last month.
+    The beginning purchase is the leftover inventory from last month.\n
+    The purchases and sales are never copied nor modified, treat them as frozen
+    while the Inventory is in use.\n
+    The matching is done once, on first use, and every accessor reads from the same result.
+    The sorted lists are also computed once, on first use; purchases and sales that
+    already come in date order are not sorted at all.
 
     """
 
-    purchase_list: list[Purchases] = field(
-        factory=list, converter=lambda x: [copy.deepcopy(y) for y in x]
+    purchase_list: list[Purchases] | TransactionBatch = field(
+        factory=list, converter=_as_transactions
     )
-    sales_list: list[Sales] = field(
-        factory=list, converter=lambda x: [copy.deepcopy(y) for y in x]
+    sales_list: list[Sales] | TransactionBatch = field(
+        factory=list, converter=_as_transactions
+    )
+    price_scale: int | None = field(
+        default=None, kw_only=True, validator=optional([instance_of(int), gt(0)])
+    )
+    collect_stats: bool = field(default=False, kw_only=True, eq=False, repr=False)
+    on_stats: Callable[[ValuationStats], None] | None = field(
+        default=None, kw_only=True, eq=False, repr=False
+    )
+    cache_stats: CacheStats = field(init=False, factory=CacheStats, eq=False, repr=False)
+    _result: FifoResult | None = field(init=False, default=None, eq=False, repr=False)
+    _orderings: dict[str, Sequence[Purchases]] = field(
+        init=False, factory=dict, eq=False, repr=False
     )
 
+    def _ordering(self, name: str, build) -> Sequence[Purchases]:
+        if name not in self._orderings:
+            self._orderings[name] = build()
+        return self._orderings[name]
+
     @property
     def purchase_list_sorted(self):
-        return sorted(self.purchase_list, key=lambda k: (k.date_iso, k.index))
+        return self._ordering(
+            "purchase_list_sorted", lambda: _sorted_transactions(self.purchase_list)
+        )
 
     @property
     def sales_list_sorted(self):
-        return sorted(self.sales_list, key=lambda k: (k.date_iso, k.index))
+        return self._ordering(
+            "sales_list_sorted", lambda: _sorted_transactions(self.sales_list)
+        )
 
     @property
     def transaction_list(self):
-        return self.purchase_list_sorted + self.sales_list_sorted
+        return self._ordering(
+            "transaction_list", lambda: [*self.purchase_list_sorted, *self.sales_list_sorted]
+        )
 
     @property
     def sorted_jobs_list(self):
-        return sorted(self.transaction_list, key=lambda k: k.date_iso)
+        # both lists are sorted already, merging them keeps purchases before sales on the same date
+        return self._ordering(
+            "sorted_jobs_list",
+            lambda: list(
+                heapq.merge(self.purchase_list_sorted, self.sales_list_sorted, key=_fifo_order)
+            ),
+        )
+
+    @property
+    def result(self) -> FifoResult:
+        """The matching result, calculated on first access and reused afterwards.
+
+        Every access is counted in cache_stats.
+
+        Raises
+        ------
+        SalesMoreThanInventoryError
+                        When a sale is larger than the inventory on hand, nothing is cached in that case.
+        """
+        if self._result is None:
+            self.cache_stats.misses += 1
+            object.__setattr__(self, "_result", self._calculate())
+        else:
+            self.cache_stats.hits += 1
+        return self._result
 
     def sales_revenue(self) -> float:
         """The sum of products of all orders."""
-        earnings = [x.total_value for x in self.sales_list]
-        return sum(earnings)
+        return self.result.sales_revenue
 
     def cogs_inventory(
         self,
@@ -200,114 +1224,946 @@ class Inventory:
         Notes
         -----
         These two variables are the most influential parameters in this calculation.\n
-        Most bugs can be corrected by inspecting these two variables.
+        Most bugs can be corrected by inspecting these two variables.\n
+        The remaining quantities are tracked in a side array with a running quantity on hand,
+        so the running time grows linearly with the number of transactions and slices
+        and none of the transactions are copied or modified.
 
         """
+        result = self.result
+        return list(result.cogs_list), list(result.leftover_inventory)
 
-        sorted_jobs_list = copy.deepcopy(self.sorted_jobs_list)
+    def consumption_records(self) -> list[Consumption]:
+        """Lists the slices taken from each purchase batch by each sale, in the order they were taken.
 
-        cogs_list: list[Purchases] = []
-        inventory_list: list[Purchases] = []
+        Returns
+        -------
+        list[Consumption]
+                        uses the same matching as the cogs_inventory method.
+        """
+        return list(self.result.consumption)
+
+    def valuation_index(self) -> ValuationIndex:
+        """Running totals of the matched sales and purchases, built once per Inventory.
 
-        def _inventory_is_able_to_be_transfered_to_cogs_account_whole() -> bool:
-            nonlocal new_sales_item, remaining_item_in_inventory
+        Answers cogs_between, revenue_between, on_hand_as_of and inventory_value_as_of
+        without matching again.
+        """
+        return self.result.valuation_index
 
-            leftover_sales_quantity = (
-                new_sales_item.quantity - remaining_item_in_inventory.quantity
+    def iter_cogs(self) -> Iterator[Consumption]:
+        """Yields the consumption records one by one as the sales are matched.
+
+        Unlike consumption_records, nothing is cached and the records are not kept in memory.
+        """
+        return stream_cogs(
+            heapq.merge(self.purchase_list_sorted, self.sales_list_sorted, key=_fifo_order)
+        )
+
+    def _calculate(self) -> FifoResult:
+        if not self.collect_stats and self.on_stats is None:
+            return _fifo_result(
+                self.purchase_list_sorted,
+                self.sales_list_sorted,
+                _sales_revenue(self.sales_list, self.price_scale),
+                self.price_scale,
             )
-            if leftover_sales_quantity <= 0:
-                return False
-            else:
-                return True
 
-        def _transfer_entire_batch_to_cogs_account():
-            nonlocal cogs_list, inventory_list, new_sales_item
+        stats = ValuationStats()
+        started = time.perf_counter()
+        purchase_list, sales_list = self.purchase_list_sorted, self.sales_list_sorted
+        stats.sort_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        sales_revenue = _sales_revenue(self.sales_list, self.price_scale)
+        stats.value_seconds += time.perf_counter() - started
+        result = _fifo_result(purchase_list, sales_list, sales_revenue, self.price_scale, stats)
+        if self.on_stats is not None:
+            self.on_stats(stats)
+        return result
+
+    def cogs_vectorized(self) -> VectorizedCogs:
+        """Calculates the cost of goods sold with numpy, without walking the batches one by one.
+
+        The purchases and sales are laid out on two cumulative quantity curves.
+        Every sale takes the units between its previous and its own cumulative quantity,
+        and the batches it takes from are found with searchsorted on the purchase curve.
+
+        Returns
+        -------
+        VectorizedCogs
+                        The same total, cost of every sale and leftover batches as cogs_inventory,
+                        up to floating point rounding.
+
+        Raises
+        ------
+        ImportError
+                        When numpy is not installed.
+        SalesMoreThanInventoryError
+                        At the first sale that is larger than the inventory on hand, like cogs_inventory.
+        """
+        if np is None:
+            raise ImportError("cogs_vectorized requires numpy")
+
+        purchase_list = self.purchase_list_sorted
+        purchase_dates, purchase_quantities, unit_prices = _numpy_columns(purchase_list)
+        sales_dates, sales_quantities, _ = _numpy_columns(self.sales_list_sorted)
+
+        purchased = np.cumsum(purchase_quantities)
+        purchased_before = purchased - purchase_quantities
+        sold = np.cumsum(sales_quantities)
+        sold_before = sold - sales_quantities
+
+        # purchases on the same date as a sale are available to it
+        arrived = np.searchsorted(purchase_dates, sales_dates, side="right")
+        available = np.concatenate(([0], purchased))[arrived]
+        if np.any(sold > available):
+            raise _oversold_error(
+                self.sales_list_sorted,
+                _oversold_positions(
+                    purchase_dates, purchase_quantities, sales_dates, sales_quantities
+                ),
+            )
+
+        # sale j takes the units (sold_before[j], sold[j]] of the purchase curve
+        first_batch = np.searchsorted(purchased, sold_before, side="right")
+        last_batch = np.searchsorted(purchased, sold, side="left")
+        slice_counts = np.where(sold > sold_before, last_batch - first_batch + 1, 0)
+        slice_sales = np.repeat(np.arange(sold.size), slice_counts)
+        slice_offsets = np.arange(slice_sales.size) - np.repeat(
+            np.cumsum(slice_counts) - slice_counts, slice_counts
+        )
+        slice_batches = np.repeat(first_batch, slice_counts) + slice_offsets
+        slice_quantities = np.minimum(
+            purchased[slice_batches], sold[slice_sales]
+        ) - np.maximum(purchased_before[slice_batches], sold_before[slice_sales])
+        sales_cogs = np.bincount(
+            slice_sales,
+            weights=slice_quantities * unit_prices[slice_batches],
+            minlength=sold.size,
+        )
+
+        total_sold = sold[-1] if sold.size else 0
+        remaining = purchased - np.maximum(purchased_before, total_sold)
+        leftover_batches = np.flatnonzero(remaining > 0)
+        return VectorizedCogs(
+            cogs=float(sales_cogs.sum()),
+            sales_cogs=sales_cogs,
+            leftover_inventory=tuple(
+                _with_quantity(purchase_list[position], int(remaining[position]))
+                for position in leftover_batches.tolist()
+            ),
+        )
+
+    def cogs(self) -> float:
+        """Calculates the cost of goods sold calculation from cogs_inventory method.
+
+        Returns
+        -------
+        float
+                        uses the cached result shared with the cogs_inventory method.
+        """
+        return self.result.cogs
+
+    def leftover_inventory(self) -> list[Purchases]:
+        """
+        Outputs the leftover inventory after all transfers at the end of the month
+
+        Returns
+        -------
+        list[Purchases]
+            uses the cached result shared with the cogs_inventory method.
+        """
+        return list(self.result.leftover_inventory)
+
+
+
+
+@frozen
+class MultiFifoResult:
+    """The outcome of matching a MultiInventory.
+
+    Attributes
+    ----------
+    by_sku
+                    The FifoResult of every item.
+    cogs
+                    Total cost of goods sold of all items.
+    sales_revenue
+                    Total sales revenue of all items.
+    leftover_inventory
+                    The batches of all items with inventory left, sorted by date and batch no.
+    """
+
+    by_sku: dict[str | None, FifoResult]
+    cogs: float
+    sales_revenue: float
+    leftover_inventory: tuple[Purchases, ...]
+
+
+@frozen
+class MultiInventory:
+    """Enables the calculation of revenues and cost of goods sold for many items at once.
+
+    The transactions are sorted once, partitioned by sku and every item is matched
+    against its own batches, so the cost grows with the number of transactions
+    rather than with the number of items.
+
+    Parameters
+    ----------
+    purchase_list : list[Purchases]
+                    List of all the inventory ins, of any item.
+
+    sales_list : list[Sales]
+                    List of all the inventory outs, of any item.
+
+    Notes
+    -----
+    Transactions without a sku are treated as one more item, the None item.
+
+    """
+
+    purchase_list: list[Purchases] = field(factory=list, converter=list)
+    sales_list: list[Sales] = field(factory=list, converter=list)
+    cache_stats: CacheStats = field(init=False, factory=CacheStats, eq=False, repr=False)
+    _result: MultiFifoResult | None = field(init=False, default=None, eq=False, repr=False)
+
+    @property
+    def result(self) -> MultiFifoResult:
+        """The matching result of all items, calculated on first access and reused afterwards.
+
+        Raises
+        ------
+        SalesMoreThanInventoryError
+                        When a sale is larger than the inventory on hand of its item.
+        """
+        if self._result is None:
+            self.cache_stats.misses += 1
+            object.__setattr__(self, "_result", self._calculate())
+        else:
+            self.cache_stats.hits += 1
+        return self._result
+
+    @property
+    def skus(self) -> list[str | None]:
+        return list(self.result.by_sku)
+
+    def cogs(self, sku: str | None = ...) -> float:
+        """Cost of goods sold of one item, or of all items when no sku is given."""
+        if sku is ...:
+            return self.result.cogs
+        return self.result.by_sku[sku].cogs
+
+    def sales_revenue(self, sku: str | None = ...) -> float:
+        """Sales revenue of one item, or of all items when no sku is given."""
+        if sku is ...:
+            return self.result.sales_revenue
+        return self.result.by_sku[sku].sales_revenue
+
+    def leftover_inventory(self, sku: str | None = ...) -> list[Purchases]:
+        """Leftover batches of one item, or of all items when no sku is given."""
+        if sku is ...:
+            return list(self.result.leftover_inventory)
+        return list(self.result.by_sku[sku].leftover_inventory)
+
+    def _calculate(self) -> MultiFifoResult:
+        purchases_by_sku: dict[str | None, list[Purchases]] = {}
+        sales_by_sku: dict[str | None, list[Sales]] = {}
+        for x in _sorted_transactions(self.purchase_list):
+            purchases_by_sku.setdefault(x.sku, []).append(x)
+        for x in _sorted_transactions(self.sales_list):
+            sales_by_sku.setdefault(x.sku, []).append(x)
+
+        # revenue is added up in the given order, the same as Inventory.sales_revenue
+        revenue_by_sku: dict[str | None, float] = {}
+        for x in self.sales_list:
+            revenue_by_sku[x.sku] = revenue_by_sku.get(x.sku, 0) + x.total_value
+
+        by_sku = {}
+        errors: dict[str | None, SalesMoreThanInventoryError] = {}
+        for sku in purchases_by_sku | sales_by_sku:
+            try:
+                by_sku[sku] = _fifo_result(
+                    purchases_by_sku.get(sku, []),
+                    sales_by_sku.get(sku, []),
+                    revenue_by_sku.get(sku, 0),
+                )
+            except SalesMoreThanInventoryError as error:
+                # every item is checked, so all oversold sales are reported together
+                errors[sku] = error
+        if errors:
+            raise SalesMoreThanInventoryError(
+                f"sku {', '.join(map(repr, errors))}",
+                oversold=sorted(
+                    itertools.chain.from_iterable(x.oversold for x in errors.values()),
+                    key=_date_and_index,
+                ),
+            ) from next(iter(errors.values()))
+
+        return MultiFifoResult(
+            by_sku=by_sku,
+            cogs=sum([x.cogs for x in by_sku.values()]),
+            sales_revenue=sum([x.sales_revenue for x in by_sku.values()]),
+            leftover_inventory=tuple(
+                sorted(
+                    itertools.chain.from_iterable(
+                        x.leftover_inventory for x in by_sku.values()
+                    ),
+                    key=lambda k: (k.date_iso, k.index),
+                )
+            ),
+        )
+
+
+@frozen
+class ParallelValuation:
+    """The merged outcome of value_in_parallel.
+
+    Attributes
+    ----------
+    cogs_by_sku
+                    Cost of goods sold of every item.
+    sales_revenue_by_sku
+                    Sales revenue of every item, added up in date order.
+    leftover_by_sku
+                    The batches of every item with inventory left.
+    cogs
+                    Total cost of goods sold of all items.
+    sales_revenue
+                    Total sales revenue of all items.
+    leftover_inventory
+                    The batches of all items with inventory left, sorted by date and batch no.
+    """
+
+    cogs_by_sku: dict[str | None, float]
+    sales_revenue_by_sku: dict[str | None, float]
+    leftover_by_sku: dict[str | None, tuple[Purchases, ...]]
+    cogs: float
+    sales_revenue: float
+    leftover_inventory: tuple[Purchases, ...]
+
+
+def _columns(transactions: Sequence[Purchases]) -> Tuple[array, array, array]:
+    """Date ordinals, quantities and unit prices of sorted transactions as compact arrays."""
+    if isinstance(transactions, TransactionBatch):
+        return transactions.dates, transactions.quantities, transactions.unit_prices
+    return (
+        array("l", [x.date_iso.toordinal() for x in transactions]),
+        array("q", [x.quantity for x in transactions]),
+        array("d", [x.unit_price for x in transactions]),
+    )
+
+
+def _value_shard(shard: list) -> list:
+    """Worker of value_in_parallel, values every item of a shard from its columns.
 
-            cogs_list.append(copy.deepcopy(remaining_item_in_inventory))
-            inventory_list.remove(remaining_item_in_inventory)
-            new_sales_item.quantity -= remaining_item_in_inventory.quantity
+    Returns (sku, cogs, sales revenue, positions of the leftover batches, their remaining quantities,
+    oversold positions and shortfalls) for every item, in the order of the shard.
+    An oversold item is not matched, its cogs, revenue and leftovers are None.
+    """
+    valuations = []
+    for sku, purchase_columns, sales_columns in shard:
+        purchase_dates, purchase_quantities, purchase_prices = purchase_columns
+        sales_dates, sales_quantities, sales_prices = sales_columns
+        oversold = _oversold_positions(
+            purchase_dates, purchase_quantities, sales_dates, sales_quantities
+        )
+        if oversold:
+            valuations.append((sku, None, None, None, None, oversold))
+            continue
+        slices, remaining, oldest = _fifo_slices(
+            purchase_dates, purchase_quantities, sales_dates, sales_quantities
+        )
+        cogs = sum(
+            [quantity * purchase_prices[position] for _, position, quantity in zip(*slices)]
+        )
+        revenue = sum([q * p for q, p in zip(sales_quantities, sales_prices)])
+        leftover_positions = array(
+            "q", [x for x in range(oldest, len(remaining)) if remaining[x] != 0]
+        )
+        leftover_quantities = array("q", [remaining[x] for x in leftover_positions])
+        valuations.append((sku, cogs, revenue, leftover_positions, leftover_quantities, oversold))
+    return valuations
+
+
+def _split_by_sku(batch: TransactionBatch) -> dict[str | None, TransactionBatch]:
+    """The rows of a batch grouped by sku, keeping their order."""
+    if batch.skus is None:
+        return {None: batch} if len(batch) else {}
+    codes = {sku: code for code, sku in enumerate(dict.fromkeys(batch.skus))}
+    if len(codes) == 1:
+        return {sku: batch for sku in codes}
+    if np is None:
+        positions_by_sku: dict[str | None, list[int]] = {sku: [] for sku in codes}
+        for position, sku in enumerate(batch.skus):
+            positions_by_sku[sku].append(position)
+        return {sku: batch.take(positions) for sku, positions in positions_by_sku.items()}
+
+    # a stable sort by sku keeps the rows of every sku in order, then each sku is one slice
+    sku_codes = np.fromiter(map(codes.__getitem__, batch.skus), np.int64, len(batch))
+    order = np.argsort(sku_codes, kind="stable")
+    bounds = np.searchsorted(sku_codes[order], np.arange(len(codes) + 1)).tolist()
+    columns = [
+        (column.typecode, np.asarray(column)[order])
+        for column in (batch.dates, batch.quantities, batch.unit_prices, batch.indices)
+    ]
+    return {
+        sku: TransactionBatch(
+            batch.classification,
+            *(array(typecode, column[start:stop].tobytes()) for typecode, column in columns),
+            [sku] * (stop - start),
+        )
+        for sku, start, stop in zip(codes, bounds, bounds[1:])
+    }
+
+
+def value_in_parallel(
+    purchase_list: Sequence[Purchases] | TransactionBatch,
+    sales_list: Sequence[Sales] | TransactionBatch,
+    max_workers: int | None = None,
+    executor: Executor | None = None,
+) -> ParallelValuation:
+    """Values every item of a multi item ledger on a pool of processes.
+
+    The items are spread over shards of about the same number of transactions.
+    Every shard is sent to a worker as compact date, quantity and price columns
+    instead of pickled transactions, and the results are merged in a fixed order,
+    so the outcome does not depend on which worker finishes first.
 
-        def _transfer_partial_batch_to_cogs_account_while_some_remains():
-            nonlocal new_sales_item, remaining_item_in_inventory, remaining_item_in_inventory, cogs_list
+    Parameters
+    ----------
+    purchase_list : list[Purchases] or TransactionBatch
+                    All the inventory ins, of any item.
+    sales_list : list[Sales] or TransactionBatch
+                    All the inventory outs, of any item.
+    max_workers : int, optional
+                    Number of processes, defaults to the number of processors.
+    executor : concurrent.futures.Executor, optional
+                    A pool to reuse instead of starting a new ProcessPoolExecutor.
+
+    Raises
+    ------
+    SalesMoreThanInventoryError
+                    When a sale is larger than the inventory on hand of its item,
+                    the oversold sales of every item are reported together.
 
-            leftover_sales_quantity = (
-                new_sales_item.quantity - remaining_item_in_inventory.quantity
+    Notes
+    -----
+    The same date rules as Inventory.cogs_inventory apply within every item.
+    TransactionBatch input is split by sku on its columns, lists are converted to a batch once.
+    The sufficiency check runs in the workers, alongside the matching.
+    """
+    batches = []
+    for classification, transactions in (("purchases", purchase_list), ("sales", sales_list)):
+        if not isinstance(transactions, TransactionBatch):
+            transactions = TransactionBatch.from_transactions(classification, transactions)
+        batches.append(_split_by_sku(transactions.sorted()))
+    purchases_by_sku, sales_by_sku = batches
+    skus = list(purchases_by_sku | sales_by_sku)
+    empty = {
+        classification: TransactionBatch(classification, [], [], [], [])
+        for classification in ("purchases", "sales")
+    }
+
+    shard_count = max(1, min(len(skus), 4 * (max_workers or os.cpu_count() or 1)))
+    shards: list[list] = [[] for _ in range(shard_count)]
+    shard_sizes = [0] * shard_count
+    # the largest items are placed first, each in the lightest shard so far
+    for sku in sorted(
+        skus,
+        key=lambda k: -(len(purchases_by_sku.get(k, ())) + len(sales_by_sku.get(k, ()))),
+    ):
+        lightest = shard_sizes.index(min(shard_sizes))
+        purchases = purchases_by_sku.get(sku, empty["purchases"])
+        sales = sales_by_sku.get(sku, empty["sales"])
+        shards[lightest].append((sku, _columns(purchases), _columns(sales)))
+        shard_sizes[lightest] += len(purchases) + len(sales)
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            shard_valuations = list(pool.map(_value_shard, shards))
+    else:
+        shard_valuations = list(executor.map(_value_shard, shards))
+
+    valuations = {
+        valuation[0]: valuation[1:] for valuation in itertools.chain.from_iterable(shard_valuations)
+    }
+    # all oversold sales are reported together, in the order MultiInventory reports them
+    errors = {
+        sku: _oversold_error(sales_by_sku[sku], valuations[sku][-1])
+        for sku in skus
+        if valuations[sku][-1]
+    }
+    if errors:
+        raise SalesMoreThanInventoryError(
+            f"sku {', '.join(map(repr, errors))}",
+            oversold=sorted(
+                itertools.chain.from_iterable(x.oversold for x in errors.values()),
+                key=_date_and_index,
+            ),
+        )
+
+    cogs_by_sku, sales_revenue_by_sku, leftover_by_sku = {}, {}, {}
+    for sku in skus:
+        cogs, revenue, leftover_positions, leftover_quantities, _ = valuations[sku]
+        purchases = purchases_by_sku.get(sku, empty["purchases"])
+        cogs_by_sku[sku] = cogs
+        sales_revenue_by_sku[sku] = revenue
+        leftover_by_sku[sku] = tuple(
+            _with_quantity(purchases[position], quantity)
+            for position, quantity in zip(leftover_positions, leftover_quantities)
+        )
+
+    return ParallelValuation(
+        cogs_by_sku=cogs_by_sku,
+        sales_revenue_by_sku=sales_revenue_by_sku,
+        leftover_by_sku=leftover_by_sku,
+        cogs=sum(cogs_by_sku.values()),
+        sales_revenue=sum(sales_revenue_by_sku.values()),
+        leftover_inventory=tuple(
+            sorted(
+                itertools.chain.from_iterable(leftover_by_sku.values()),
+                key=lambda k: (k.date_iso, k.index),
             )
+        ),
+    )
 
-            sales_clone = copy.deepcopy(remaining_item_in_inventory)
-            sales_clone.quantity += leftover_sales_quantity
-            remaining_item_in_inventory.quantity -= sales_clone.quantity
-            new_sales_item.quantity -= sales_clone.quantity
-            cogs_list.append(sales_clone)
 
-        def _has_already_transferred_all_new_sales() -> bool:
-            nonlocal new_sales_item
-            if new_sales_item.quantity == 0:
-                return True
-            else:
-                return False
+def _fifo_order(transaction: Purchases) -> Tuple[dt.date, int, int]:
+    """Sorting key of a transaction, purchases come before sales on the same date."""
+    return (
+        transaction.date_iso,
+        transaction.classification != "purchases",
+        transaction.index,
+    )
 
-        def _is_selling_more_than_what_you_have() -> bool:
-            nonlocal new_sales_item, inventory_list
 
-            total_inventory_left = sum([y.quantity for y in inventory_list])
+@define
+class _LedgerState:
+    """The running state of a FifoLedger, the open batches are [remaining quantity, purchase] pairs."""
 
-            if new_sales_item.quantity > total_inventory_left:
-                return True
-            else:
-                return False
+    open_lots: deque[list] = field(factory=deque)
+    quantity_on_hand: int = 0
+    cogs: float = 0
+    sales_revenue: float = 0
+    event_count: int = 0
+    consumption_count: int = 0
 
-        for transaction_item in sorted_jobs_list.copy():
-            if transaction_item.classification not in ("purchases", "sales"):
-                continue
-            if (transaction_item.classification == "purchases") and (
-                transaction_item.classification != "sales"
-            ):
-                inventory_list.append(transaction_item)
-                continue
 
-            new_sales_item = transaction_item
-            if _is_selling_more_than_what_you_have():
-                raise SalesMoreThanInventoryError
+@frozen
+class _LedgerCheckpoint:
+    open_lots: tuple[Tuple[int, Purchases], ...]
+    quantity_on_hand: int
+    cogs: float
+    sales_revenue: float
+    event_count: int
+    consumption_count: int
 
-            for remaining_item_in_inventory in inventory_list.copy():
-                if _has_already_transferred_all_new_sales():
-                    continue
+    @classmethod
+    def take(cls, state: _LedgerState) -> "_LedgerCheckpoint":
+        return cls(
+            tuple((remaining, batch) for remaining, batch in state.open_lots),
+            state.quantity_on_hand,
+            state.cogs,
+            state.sales_revenue,
+            state.event_count,
+            state.consumption_count,
+        )
+
+    def restore(self) -> _LedgerState:
+        return _LedgerState(
+            deque([remaining, batch] for remaining, batch in self.open_lots),
+            self.quantity_on_hand,
+            self.cogs,
+            self.sales_revenue,
+            self.event_count,
+            self.consumption_count,
+        )
 
-                if _inventory_is_able_to_be_transfered_to_cogs_account_whole():
-                    _transfer_entire_batch_to_cogs_account()
-                else:
-                    _transfer_partial_batch_to_cogs_account_while_some_remains()
 
-        for i in inventory_list:
-            if i.quantity == 0:
-                inventory_list.remove(i)
-        return cogs_list, inventory_list
+@frozen
+class Scenario:
+    """
+    A hypothetical change to a FifoLedger, evaluated without changing the ledger.
 
-    def cogs(self) -> float:
-        """Calculates the cost of goods sold calculation from cogs_inventory method.
+    Parameters
+    ----------
+    added
+                    Purchases and sales that would be added.
+    removed
+                    Purchases and sales of the ledger that would be left out.
+                    An edit is a removed transaction together with its added replacement.
 
-        Returns
-        -------
-        float
-                        uses the result of the cogs_inventory method.
+    """
+
+    added: tuple[Purchases, ...] = field(default=(), converter=tuple)
+    removed: tuple[Purchases, ...] = field(default=(), converter=tuple)
+
+    @classmethod
+    def edit(cls, original: Purchases, replacement: Purchases) -> "Scenario":
+        """What if original had been replacement instead."""
+        return cls(added=[replacement], removed=[original])
+
+
+@frozen
+class ScenarioResult:
+    """
+    The outcome of a Scenario.
+
+    Attributes
+    ----------
+    scenario
+                    The evaluated scenario.
+    cogs
+                    Total cost of goods sold with the scenario applied.
+    sales_revenue
+                    Total sales revenue with the scenario applied.
+    leftover_inventory
+                    The batches with inventory left with the scenario applied.
+    replayed_events
+                    Transactions matched again from the nearest checkpoint, the rest was reused.
+
+    """
+
+    scenario: Scenario = field(repr=False)
+    cogs: float
+    sales_revenue: float
+    leftover_inventory: tuple[Purchases, ...] = field(repr=False)
+    replayed_events: int
+
+
+# the ledger the scenarios of a worker process are evaluated against, see FifoLedger.evaluate_all
+_scenario_ledger: "FifoLedger | None" = None
+
+
+def _install_scenario_ledger(ledger: "FifoLedger") -> None:
+    global _scenario_ledger
+    _scenario_ledger = ledger
+
+
+def _evaluate_installed(scenario: Scenario) -> ScenarioResult:
+    return _scenario_ledger.evaluate(scenario)
+
+
+def _evaluate_or_return(evaluate, scenario: Scenario) -> ScenarioResult | Exception:
+    try:
+        return evaluate(scenario)
+    except SalesMoreThanInventoryError as error:
+        return error
+
+
+@define
+class FifoLedger:
+    """A stateful first in first out ledger that accepts transactions one at a time.
+
+    Transactions added in date order are matched as they arrive,
+    which keeps the open batches, cost of goods sold and sales revenue up to date
+    in amortized constant time per transaction.\n
+    A transaction dated before the watermark (the latest transaction so far) is slotted
+    into place and only the transactions after the nearest checkpoint before it are matched again.
+
+    Parameters
+    ----------
+    checkpoint_interval : int
+                    Minimum number of transactions between two checkpoints.
+                    The interval also grows with the number of open batches to keep checkpoints cheap.
+
+    Notes
+    -----
+    The same date rules as Inventory.cogs_inventory apply, purchases take precedence over sales on the same day.\n
+    The purchases and sales are never copied nor modified.
+
+    """
+
+    checkpoint_interval: int = field(default=1024, validator=instance_of(int))
+    replayed_events: int = field(init=False, default=0)
+    _events: list[Purchases] = field(init=False, factory=list, repr=False)
+    _keys: list[Tuple[dt.date, int, int]] = field(init=False, factory=list, repr=False)
+    _consumption: list[Consumption] = field(init=False, factory=list, repr=False)
+    _state: _LedgerState = field(init=False, factory=_LedgerState, repr=False)
+    _checkpoints: list[_LedgerCheckpoint] = field(init=False, repr=False)
+
+    @_checkpoints.default
+    def _first_checkpoint(self) -> list[_LedgerCheckpoint]:
+        return [_LedgerCheckpoint.take(self._state)]
+
+    @property
+    def watermark(self) -> Tuple[dt.date, int, int] | None:
+        """Sorting key of the latest transaction in the ledger."""
+        return self._keys[-1] if self._keys else None
+
+    def add_purchase(self, purchase: Purchases) -> None:
+        """Adds a purchase batch to the ledger."""
+        if purchase.classification != "purchases":
+            raise TypeError("add_purchase only accepts Purchases")
+        self._add(purchase)
+
+    def add_sale(self, sale: Sales) -> None:
+        """Adds a sales order to the ledger and deducts it from the open batches.
+
+        Raises
+        ------
+        SalesMoreThanInventoryError
+                        When the sale, or any later sale, cannot be filled. The ledger is left unchanged.
         """
-        cost_of_goods_list, _ = self.cogs_inventory()
-        cost_of_goods = [v.total_value for v in cost_of_goods_list]
-        return sum(cost_of_goods)
+        if sale.classification != "sales":
+            raise TypeError("add_sale only accepts Sales")
+        self._add(sale)
+
+    def cogs(self) -> float:
+        """The running cost of goods sold."""
+        return self._state.cogs
+
+    def sales_revenue(self) -> float:
+        """The running sales revenue."""
+        return self._state.sales_revenue
 
     def leftover_inventory(self) -> list[Purchases]:
+        """The batches that still hold inventory."""
+        return [
+            _with_quantity(batch, remaining)
+            for remaining, batch in self._state.open_lots
+            if remaining != 0
+        ]
+
+    def consumption_records(self) -> list[Consumption]:
+        """The slices taken from each purchase batch by each sale, in the order they were taken."""
+        return list(self._consumption)
+
+    def evaluate(self, scenario: Scenario) -> ScenarioResult:
+        """Values the ledger as if the scenario had happened, the ledger itself is left unchanged.
+
+        Everything before the earliest changed transaction is the same as in the ledger,
+        so matching resumes from the nearest checkpoint before it.
+
+        Raises
+        ------
+        SalesMoreThanInventoryError
+                        When a sale cannot be filled in the scenario.
         """
-        Outputs the leftover inventory after all transfers at the end of the month
+        changed = [_fifo_order(x) for x in (*scenario.added, *scenario.removed)]
+        removed = {(x.classification, x.index) for x in scenario.removed}
+        state = self._state
+        replayed = 0
+        if changed:
+            position = bisect.bisect_left(self._keys, min(changed))
+            checkpoint = self._checkpoints[
+                bisect.bisect_right(self._checkpoints, position, key=lambda cp: cp.event_count)
+                - 1
+            ]
+            state = checkpoint.restore()
+            kept = (
+                event
+                for event in itertools.islice(self._events, checkpoint.event_count, None)
+                if not removed or (event.classification, event.index) not in removed
+            )
+            consumption: list[Consumption] = []
+            for event in heapq.merge(kept, sorted(scenario.added, key=_fifo_order), key=_fifo_order):
+                self._apply(state, event, consumption)
+                consumption.clear()
+                replayed += 1
+        return ScenarioResult(
+            scenario,
+            state.cogs,
+            state.sales_revenue,
+            tuple(
+                _with_quantity(batch, remaining)
+                for remaining, batch in state.open_lots
+                if remaining != 0
+            ),
+            replayed,
+        )
+
+    def evaluate_all(
+        self,
+        scenarios: Iterable[Scenario],
+        max_workers: int | None = None,
+        executor: Executor | None = None,
+        return_exceptions: bool = False,
+    ) -> list[ScenarioResult | SalesMoreThanInventoryError]:
+        """Evaluates independent scenarios in parallel, the results come in the order of the scenarios.
 
-        Returns
-        -------
-        list[Purchases]
-            uses the result of the cogs_inventory method.
+        Parameters
+        ----------
+        max_workers : int, optional
+                        Number of worker processes, by default the number of processors.
+        executor : concurrent.futures.Executor, optional
+                        Runs the scenarios instead of a new process pool.
+                        The ledger is then sent along with every scenario, unless the executor runs threads.
+        return_exceptions : bool
+                        When True, a scenario that oversells gives its SalesMoreThanInventoryError
+                        in place of a result, instead of raising it.
         """
-        return self.cogs_inventory()[1]
+        scenarios = list(scenarios)
+        if executor is None:
+            # every worker receives the ledger once, then only the scenarios travel
+            with ProcessPoolExecutor(
+                max_workers,
+                initializer=_install_scenario_ledger,
+                initargs=(self,),
+            ) as process_pool:
+                return self._evaluate_with(
+                    process_pool, _evaluate_installed, scenarios, return_exceptions
+                )
+        return self._evaluate_with(executor, self.evaluate, scenarios, return_exceptions)
+
+    @staticmethod
+    def _evaluate_with(
+        executor: Executor, evaluate, scenarios: list[Scenario], return_exceptions: bool
+    ) -> list[ScenarioResult | SalesMoreThanInventoryError]:
+        if return_exceptions:
+            evaluate = functools.partial(_evaluate_or_return, evaluate)
+        return list(executor.map(evaluate, scenarios))
+
+    def _add(self, transaction: Purchases) -> None:
+        key = _fifo_order(transaction)
+        if not self._keys or key >= self._keys[-1]:
+            self._apply(self._state, transaction, self._consumption)
+            self._events.append(transaction)
+            self._keys.append(key)
+            self._maybe_checkpoint(self._state, self._checkpoints, self._checkpoints[-1])
+        else:
+            self._rematch(bisect.bisect_right(self._keys, key), key, transaction)
+
+    def _rematch(
+        self, position: int, key: Tuple[dt.date, int, int], transaction: Purchases
+    ) -> None:
+        kept = (
+            bisect.bisect_right(
+                self._checkpoints, position, key=lambda cp: cp.event_count
+            )
+            - 1
+        )
+        checkpoint = self._checkpoints[kept]
+        state = checkpoint.restore()
+        consumption: list[Consumption] = []
+        checkpoints: list[_LedgerCheckpoint] = []
+
+        replay = itertools.chain(
+            self._events[checkpoint.event_count : position],
+            (transaction,),
+            self._events[position:],
+        )
+        for event in replay:
+            self._apply(state, event, consumption)
+            self._maybe_checkpoint(state, checkpoints, checkpoint)
+
+        # nothing is changed until the whole replay succeeded
+        self.replayed_events += state.event_count - checkpoint.event_count
+        self._events.insert(position, transaction)
+        self._keys.insert(position, key)
+        del self._consumption[checkpoint.consumption_count :]
+        self._consumption.extend(consumption)
+        del self._checkpoints[kept + 1 :]
+        self._checkpoints.extend(checkpoints)
+        self._state = state
+
+    def _maybe_checkpoint(
+        self,
+        state: _LedgerState,
+        checkpoints: list[_LedgerCheckpoint],
+        start: _LedgerCheckpoint,
+    ) -> None:
+        """Appends a checkpoint of state to checkpoints, which continue after the checkpoint start."""
+        last_checkpoint = checkpoints[-1] if checkpoints else start
+        interval = max(self.checkpoint_interval, len(state.open_lots))
+        if state.event_count - last_checkpoint.event_count >= interval:
+            checkpoints.append(_LedgerCheckpoint.take(state))
+
+    @staticmethod
+    def _apply(
+        state: _LedgerState, transaction: Purchases, consumption: list[Consumption]
+    ) -> None:
+        if transaction.classification == "purchases":
+            state.open_lots.append([transaction.quantity, transaction])
+            state.quantity_on_hand += transaction.quantity
+            state.event_count += 1
+            return
+
+        unfilled_quantity = transaction.quantity
+        if unfilled_quantity > state.quantity_on_hand:
+            raise SalesMoreThanInventoryError(
+                oversold=[
+                    OversoldSale(
+                        transaction.index,
+                        transaction.date_iso,
+                        unfilled_quantity - state.quantity_on_hand,
+                        transaction.sku,
+                    )
+                ]
+            )
+        state.quantity_on_hand -= unfilled_quantity
+        state.sales_revenue += transaction.total_value
+
+        while unfilled_quantity:
+            oldest_lot = state.open_lots[0]
+            remaining, batch = oldest_lot
+            if unfilled_quantity >= remaining:
+                # the whole batch is transferred to the cogs account
+                state.open_lots.popleft()
+                if not remaining:
+                    # nothing is taken from an empty batch
+                    continue
+                quantity = remaining
+            else:
+                # part of the batch is transferred, the rest stays in inventory
+                oldest_lot[0] = remaining - unfilled_quantity
+                quantity = unfilled_quantity
+            unfilled_quantity -= quantity
+            consumption.append(
+                Consumption(
+                    transaction.index,
+                    batch.index,
+                    batch.date_iso,
+                    quantity,
+                    batch.unit_price,
+                )
+            )
+            state.cogs += quantity * batch.unit_price
+            state.consumption_count += 1
+        state.event_count += 1
 
 
+def stream_cogs(
+    transactions: Iterable[Purchases], leftover_inventory: list | None = None
+) -> Iterator[Consumption]:
+    """Matches a stream of transactions and yields the consumption records as each sale is matched.
+
+    Only the open batches are kept in memory, so a history of any length can be
+    matched with memory bounded by the number of open batches.
+
+    Parameters
+    ----------
+    transactions
+                    Purchases and sales already in first in first out order,
+                    by date with purchases before sales on the same date, then by index.
+    leftover_inventory : list, optional
+                    When given, the batches with inventory left are added to it once the stream is exhausted.
+
+    Raises
+    ------
+    ValueError
+                    When a transaction is out of order.
+    SalesMoreThanInventoryError
+                    When a sale is larger than the inventory on hand.
+    """
+    state = _LedgerState()
+    records: list[Consumption] = []
+    previous_key = None
+    for transaction in transactions:
+        key = _fifo_order(transaction)
+        if previous_key is not None and key < previous_key:
+            raise ValueError(f"{transaction!r} is out of order")
+        previous_key = key
+        FifoLedger._apply(state, transaction, records)
+        if records:
+            yield from records
+            records.clear()
+    if leftover_inventory is not None:
+        leftover_inventory.extend(
+            _with_quantity(batch, remaining)
+            for remaining, batch in state.open_lots
+            if remaining != 0
+        )
 
 
 def main():
@@ -0,0 +1,541 @@
+"""
+Fifo IO
+=======
+
+Provides
+	1. Bulk loading of purchases and sales from CSV and Parquet files
+	2. Streaming export of consumption records and transactions to CSV and JSON Lines
+	3. Binary snapshots of the open lots at period close
+
+The files hold one transaction per row with the columns
+classification (purchases or sales), date_iso, quantity, unit_price
+and optionally sku. The rows are loaded column by column into two
+fifo.TransactionBatch, ready to be valued by fifo.Inventory::
+
+	>>> import fifo, fifo_io
+	>>> purchases, sales = fifo_io.read_csv("ledger.csv")
+	>>> fifo.Inventory(purchases, sales).cogs()
+
+The writers accept any iterable, such as fifo.Inventory.iter_cogs or fifo.stream_cogs,
+and write every record as soon as it is produced::
+
+	>>> fifo_io.write_consumption_csv(fifo.Inventory(purchases, sales).iter_cogs(), "cogs.csv")
+
+A snapshot saved at period close holds what the next period starts from,
+so the next period only values its own transactions::
+
+	>>> fifo_io.save_snapshot(fifo_io.Snapshot.close(inventory, as_of=dt.date(2024, 5, 31)), "2024-05.snap")
+	>>> snapshot = fifo_io.load_snapshot("2024-05.snap")
+	>>> snapshot.restore_indices()
+	>>> fifo.Inventory(snapshot.opening_inventory() + june_purchases, june_sales).cogs()
+
+"""
+
+from array import array
+from typing import IO, Iterable, List, Tuple
+import contextlib
+import csv
+import gc
+import json
+import itertools
+import mmap
+import os
+import struct
+import sys
+import datetime as dt
+
+from attrs import frozen, field
+
+from fifo import (
+    Consumption,
+    Purchases,
+    TransactionBatch,
+    _date_ordinals,
+    _index_allocator,
+)
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional, only read_parquet needs it
+    pyarrow = None
+
+COLUMNS = ("classification", "date_iso", "quantity", "unit_price")
+CONSUMPTION_COLUMNS = (
+    "sales_index",
+    "purchase_index",
+    "date_iso",
+    "quantity",
+    "unit_price",
+    "total_value",
+)
+CHUNK_SIZE = 1 << 16
+_ORDINAL_OF_EPOCH = dt.date(1970, 1, 1).toordinal()
+
+SNAPSHOT_MAGIC = b"FIFOSNAP"
+SNAPSHOT_VERSION = 1
+# magic, version, has skus, lot count, as of (ordinal, 0 when unknown),
+# cogs, sales revenue, next purchase index, next sales index
+_SNAPSHOT_HEADER = struct.Struct("<8sHBxxxxxqqddqq")
+_SKU_LENGTH = struct.Struct("<l")
+
+
+class _BatchColumns:
+    """The growing columns of one classification while a file is being loaded."""
+
+    def __init__(self, classification: str, with_sku: bool):
+        self.classification = classification
+        self.dates = array("l")
+        self.quantities = array("q")
+        self.unit_prices = array("d")
+        self.skus = [] if with_sku else None
+
+    def extend(
+        self,
+        dates: Iterable,
+        quantities: Iterable,
+        unit_prices: Iterable,
+        skus: Iterable | None,
+    ) -> None:
+        self.dates.extend(dates)
+        self.quantities.extend(quantities)
+        self.unit_prices.extend(unit_prices)
+        if self.skus is not None:
+            self.skus.extend(sku or None for sku in skus)
+
+    def to_batch(self) -> TransactionBatch:
+        # indices are drawn as one block, in the order of the file
+        return TransactionBatch(
+            self.classification,
+            self.dates,
+            self.quantities,
+            self.unit_prices,
+            _index_allocator(self.classification).allocate(len(self.dates)),
+            self.skus,
+        )
+
+
+def read_csv(
+    file: str | os.PathLike | IO[str], delimiter: str = ","
+) -> Tuple[TransactionBatch, TransactionBatch]:
+    """Loads purchases and sales from a CSV file with a header row.
+
+    The rows are read in chunks, every chunk is turned into columns
+    and each column is parsed in one go, without a dictionary per row.
+
+    Parameters
+    ----------
+    file
+                    A path or an open text file.
+    delimiter
+                    The column separator.
+
+    Returns
+    -------
+    purchases : TransactionBatch
+                    The purchase rows, in the order of the file.
+    sales : TransactionBatch
+                    The sales rows, in the order of the file.
+
+    Raises
+    ------
+    ValueError
+                    When a column is missing, a row is too short,
+                    or a classification, date or number is invalid.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline="") as opened_file:
+            return read_csv(opened_file, delimiter)
+
+    reader = csv.reader(file, delimiter=delimiter)
+    # blank lines are skipped
+    header = [name.strip() for name in next(filter(None, reader), [])]
+    missing = [name for name in COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    positions = [header.index(name) for name in COLUMNS]
+    sku_position = header.index("sku") if "sku" in header else None
+    if sku_position is not None:
+        positions.append(sku_position)
+    width = max(positions) + 1
+
+    batches = {
+        classification: _BatchColumns(classification, sku_position is not None)
+        for classification in ("purchases", "sales")
+    }
+    with _garbage_collection_paused():
+        while True:
+            first_line = reader.line_num + 1
+            chunk = list(itertools.islice(reader, CHUNK_SIZE))
+            if not chunk:
+                break
+            rows = chunk
+            if min(map(len, chunk)) < width:
+                rows = _complete_rows(chunk, width, first_line)
+            try:
+                for classification, columns in _split_chunk(rows, positions).items():
+                    dates, quantities, unit_prices, *skus = columns
+                    quantities = array("q", map(int, quantities))
+                    unit_prices = array("d", map(float, unit_prices))
+                    if min(quantities) < 0 or min(unit_prices) < 0:
+                        raise ValueError("Negative quantity or unit_price")
+                    batches[classification].extend(
+                        _date_ordinals(dates),
+                        quantities,
+                        unit_prices,
+                        skus[0] if skus else None,
+                    )
+            except ValueError as error:
+                # only a chunk that failed is parsed again row by row, to find the line
+                raise _invalid_row(chunk, positions, first_line) from error
+    return batches["purchases"].to_batch(), batches["sales"].to_batch()
+
+
+@contextlib.contextmanager
+def _garbage_collection_paused():
+    """The row lists of a chunk never form cycles, collecting them only slows the loading down."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _complete_rows(chunk: list[list[str]], width: int, first_line: int) -> list[list[str]]:
+    """The rows of a chunk without the blank lines, checked to have all columns."""
+    complete = []
+    for line, row in enumerate(chunk, first_line):
+        if not row:
+            continue
+        if len(row) < width:
+            raise ValueError(f"Line {line} has {len(row)} columns, expected {width}")
+        complete.append(row)
+    return complete
+
+
+def _invalid_row(chunk: list[list[str]], positions: list[int], first_line: int) -> ValueError:
+    """The error for the first row of a chunk with an invalid value, naming its line and column."""
+    parsers = (
+        ("purchases", "sales").index,
+        lambda value: _date_ordinals([value])[0],
+        int,
+        float,
+    )
+    for line, row in enumerate(chunk, first_line):
+        if not row:
+            continue
+        for name, parse, position in zip(COLUMNS, parsers, positions):
+            try:
+                invalid = parse(row[position]) < 0
+            except ValueError:
+                invalid = True
+            if invalid:
+                return ValueError(f"Line {line} has an invalid {name} {row[position]!r}")
+    return ValueError(f"Invalid row between line {first_line} and line {first_line + len(chunk) - 1}")
+
+
+def _split_chunk(chunk: list[list[str]], positions: list[int]) -> dict[str, list]:
+    """Transposes a chunk of rows into columns, separately for purchases and sales."""
+    classifications, *values = [[row[x] for row in chunk] for x in positions]
+    found = set(classifications)
+    unknown = found - {"purchases", "sales"}
+    if unknown:
+        raise ValueError(f"Unknown classification {unknown.pop()!r}")
+    if len(found) == 1:
+        return {found.pop(): values}
+    split = {}
+    for classification in found:
+        selected = [x == classification for x in classifications]
+        split[classification] = [
+            list(itertools.compress(column, selected)) for column in values
+        ]
+    return split
+
+
+def read_parquet(file: str | os.PathLike) -> Tuple[TransactionBatch, TransactionBatch]:
+    """Loads purchases and sales from a Parquet file, with the same columns as read_csv.
+
+    The date_iso column may hold dates or iso strings.
+
+    Raises
+    ------
+    ImportError
+                    When pyarrow is not installed.
+    ValueError
+                    When a column is missing, or a classification, date or number is invalid.
+    """
+    if pyarrow is None:
+        raise ImportError("read_parquet requires pyarrow")
+
+    table = pyarrow.parquet.read_table(file)
+    missing = [name for name in COLUMNS if name not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    unknown = set(table["classification"].unique().to_pylist()) - {"purchases", "sales"}
+    if unknown:
+        raise ValueError(f"Unknown classification {unknown.pop()!r}")
+
+    batches = []
+    for classification in ("purchases", "sales"):
+        rows = table.filter(pyarrow.compute.equal(table["classification"], classification))
+        columns = _BatchColumns(classification, "sku" in table.column_names)
+        dates = rows["date_iso"]
+        if pyarrow.types.is_date(dates.type):
+            ordinals = pyarrow.compute.add(
+                dates.cast(pyarrow.date32()).cast(pyarrow.int32()), _ORDINAL_OF_EPOCH
+            ).to_pylist()
+        else:
+            ordinals = _date_ordinals(dates.to_pylist())
+        columns.extend(
+            ordinals,
+            rows["quantity"].cast(pyarrow.int64()).to_pylist(),
+            rows["unit_price"].cast(pyarrow.float64()).to_pylist(),
+            rows["sku"].to_pylist() if columns.skus is not None else None,
+        )
+        batches.append(columns.to_batch())
+    return batches[0], batches[1]
+
+
+@contextlib.contextmanager
+def _opened_for_writing(file: str | os.PathLike | IO[str]):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", newline="") as opened_file:
+            yield opened_file
+    else:
+        yield file
+
+
+def _consumption_row(record: Consumption) -> tuple:
+    return (
+        record.sales_index,
+        record.purchase_index,
+        record.date_iso.isoformat(),
+        record.quantity,
+        record.unit_price,
+        record.total_value,
+    )
+
+
+def write_consumption_csv(
+    records: Iterable[Consumption], file: str | os.PathLike | IO[str]
+) -> int:
+    """Writes consumption records to a CSV file as they come, returns the number of records written."""
+    count = 0
+    with _opened_for_writing(file) as opened_file:
+        writer = csv.writer(opened_file)
+        writer.writerow(CONSUMPTION_COLUMNS)
+        for record in records:
+            writer.writerow(_consumption_row(record))
+            count += 1
+    return count
+
+
+def write_consumption_jsonl(
+    records: Iterable[Consumption], file: str | os.PathLike | IO[str]
+) -> int:
+    """Writes consumption records to a JSON Lines file as they come, returns the number of records written."""
+    count = 0
+    with _opened_for_writing(file) as opened_file:
+        for record in records:
+            opened_file.write(json.dumps(dict(zip(CONSUMPTION_COLUMNS, _consumption_row(record)))))
+            opened_file.write("\n")
+            count += 1
+    return count
+
+
+def write_csv(transactions: Iterable[Purchases], file: str | os.PathLike | IO[str]) -> int:
+    """Writes purchases and sales, such as the leftover inventory, in the format read by read_csv.
+
+    Returns the number of transactions written.
+    """
+    count = 0
+    with _opened_for_writing(file) as opened_file:
+        writer = csv.writer(opened_file)
+        writer.writerow(COLUMNS + ("sku", "index"))
+        for x in transactions:
+            writer.writerow(
+                (
+                    x.classification,
+                    x.date_iso.isoformat(),
+                    x.quantity,
+                    x.unit_price,
+                    "" if x.sku is None else x.sku,
+                    x.index,
+                )
+            )
+            count += 1
+    return count
+
+
+@frozen
+class Snapshot:
+    """
+    The state of the FIFO valuation at period close.
+
+    Attributes
+    ----------
+    as_of
+                    The last day of the period, None when unknown.
+    open_lots
+                    The purchases not consumed yet, with their remaining quantities and original indices.
+    cogs
+                    The cost of goods sold from the first period up to as_of.
+    sales_revenue
+                    The sales revenue from the first period up to as_of.
+    next_purchase_index
+                    The index the next purchase will get.
+    next_sales_index
+                    The index the next sale will get.
+
+    """
+
+    as_of: dt.date | None
+    open_lots: TransactionBatch
+    cogs: float = 0.0
+    sales_revenue: float = 0.0
+    next_purchase_index: int = field(factory=lambda: _index_allocator("purchases").peek())
+    next_sales_index: int = field(factory=lambda: _index_allocator("sales").peek())
+
+    @classmethod
+    def close(
+        cls, valuation, as_of: dt.date | None = None, previous: "Snapshot | None" = None
+    ) -> "Snapshot":
+        """Closes a period valued by a fifo.Inventory or fifo.FifoLedger.
+
+        The running totals of previous, the snapshot of the period before, are carried forward.
+        """
+        cogs = valuation.cogs()
+        sales_revenue = valuation.sales_revenue()
+        if previous is not None:
+            cogs += previous.cogs
+            sales_revenue += previous.sales_revenue
+        return cls(
+            as_of,
+            TransactionBatch.from_transactions("purchases", valuation.leftover_inventory()),
+            cogs,
+            sales_revenue,
+        )
+
+    def opening_inventory(self) -> List[Purchases]:
+        """The open lots as Purchases, to be put in front of the purchases of the next period."""
+        return list(self.open_lots)
+
+    def restore_indices(self) -> None:
+        """Moves Purchases.index_global and Sales.index_global, or those of the active
+        fifo.LedgerSequences, past the indices already handed out.
+
+        An allocator that is already further along is left as it is.
+        """
+        _index_allocator("purchases").advance_to(self.next_purchase_index)
+        _index_allocator("sales").advance_to(self.next_sales_index)
+
+
+def save_snapshot(snapshot: Snapshot, file: str | os.PathLike) -> None:
+    """Writes a snapshot to a binary file.
+
+    The header is followed by the columns of the open lots, 8 bytes per value,
+    and by the skus in utf-8 when the lots have any.
+    """
+    lots = snapshot.open_lots
+    has_skus = lots.skus is not None
+    header = _SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        has_skus,
+        len(lots),
+        0 if snapshot.as_of is None else snapshot.as_of.toordinal(),
+        snapshot.cogs,
+        snapshot.sales_revenue,
+        snapshot.next_purchase_index,
+        snapshot.next_sales_index,
+    )
+    with open(file, "wb") as opened_file:
+        opened_file.write(header)
+        for typecode, column in (
+            ("q", lots.dates),
+            ("q", lots.quantities),
+            ("d", lots.unit_prices),
+            ("q", lots.indices),
+        ):
+            column = array(typecode, column)
+            if sys.byteorder == "big":
+                column.byteswap()
+            column.tofile(opened_file)
+        if has_skus:
+            for sku in lots.skus:
+                if sku is None:
+                    opened_file.write(_SKU_LENGTH.pack(-1))
+                else:
+                    encoded = sku.encode()
+                    opened_file.write(_SKU_LENGTH.pack(len(encoded)))
+                    opened_file.write(encoded)
+
+
+def load_snapshot(file: str | os.PathLike) -> Snapshot:
+    """Reads a snapshot written by save_snapshot.
+
+    The file is memory-mapped, the columns are copied straight from the mapping
+    without going through Python objects.
+
+    Raises
+    ------
+    ValueError
+                    When the file is not a snapshot, is truncated or has an unknown version.
+    """
+    with open(file, "rb") as opened_file, mmap.mmap(
+        opened_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapping:
+        if len(mapping) < _SNAPSHOT_HEADER.size:
+            raise ValueError("Not a snapshot file")
+        (
+            magic,
+            version,
+            has_skus,
+            lot_count,
+            as_of,
+            cogs,
+            sales_revenue,
+            next_purchase_index,
+            next_sales_index,
+        ) = _SNAPSHOT_HEADER.unpack_from(mapping)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a snapshot file")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        offset = _SNAPSHOT_HEADER.size
+        if len(mapping) < offset + 32 * lot_count:
+            raise ValueError("Truncated snapshot file")
+
+        columns = []
+        with memoryview(mapping) as view:
+            for typecode in "qqdq":
+                column = array(typecode)
+                column.frombytes(view[offset : offset + 8 * lot_count])
+                if sys.byteorder == "big":
+                    column.byteswap()
+                columns.append(column)
+                offset += 8 * lot_count
+        skus = None
+        if has_skus:
+            skus = []
+            for _ in range(lot_count):
+                (length,) = _SKU_LENGTH.unpack_from(mapping, offset)
+                offset += _SKU_LENGTH.size
+                if length < 0:
+                    skus.append(None)
+                else:
+                    skus.append(mapping[offset : offset + length].decode())
+                    offset += length
+
+    dates, quantities, unit_prices, indices = columns
+    return Snapshot(
+        dt.date.fromordinal(as_of) if as_of else None,
+        TransactionBatch("purchases", dates, quantities, unit_prices, indices, skus),
+        cogs,
+        sales_revenue,
+        next_purchase_index,
+        next_sales_index,
+    )
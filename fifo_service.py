@@ -0,0 +1,200 @@
+"""
+Fifo Service
+============
+
+Provides
+	1. Valuation of ledgers from asyncio code without blocking the event loop
+	2. One calculation for many simultaneous requests on the same ledger
+
+Transactions are added to a named ledger, every addition gives the ledger
+a new version. The matching runs in an executor, once per version::
+
+	>>> import fifo_service
+	>>> async with fifo_service.ValuationService() as service:
+	...     service.add("shop", purchases, sales)
+	...     valuation = await service.valuation("shop")
+	...     valuation.cogs
+
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Sequence
+import asyncio
+
+from attrs import frozen
+
+from fifo import CacheStats, Inventory, Purchases, Sales, TransactionBatch
+
+
+@frozen
+class Valuation:
+    """
+    The valuation of one version of a ledger.
+
+    Attributes
+    ----------
+    ledger_id
+                    The name of the ledger.
+    version
+                    The number of additions made to the ledger when it was valued.
+    cogs
+                    Total cost of goods sold.
+    sales_revenue
+                    Total sales revenue.
+    leftover_inventory
+                    The batches with inventory left after all sales.
+
+    """
+
+    ledger_id: str
+    version: int
+    cogs: float
+    sales_revenue: float
+    leftover_inventory: tuple[Purchases, ...]
+
+
+def _value(
+    ledger_id: str,
+    version: int,
+    purchase_batches: tuple[TransactionBatch, ...],
+    sales_batches: tuple[TransactionBatch, ...],
+    price_scale: int | None,
+) -> Valuation:
+    """Values a ledger from the batches added to it, run in the executor."""
+    inventory = Inventory(
+        TransactionBatch.concatenate("purchases", purchase_batches),
+        TransactionBatch.concatenate("sales", sales_batches),
+        price_scale=price_scale,
+    )
+    return Valuation(
+        ledger_id,
+        version,
+        inventory.cogs(),
+        inventory.sales_revenue(),
+        tuple(inventory.leftover_inventory()),
+    )
+
+
+def _as_batch(
+    classification: str, transactions: TransactionBatch | Iterable[Purchases]
+) -> TransactionBatch:
+    if isinstance(transactions, TransactionBatch):
+        return transactions
+    return TransactionBatch.from_transactions(classification, transactions)
+
+
+class ValuationService:
+    """
+    Values ledgers in an executor, for callers on an asyncio event loop.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor, optional
+                    Runs the matching, by default a ProcessPoolExecutor owned by the service.
+    max_workers : int, optional
+                    Number of processes of the default executor.
+    price_scale : int, optional
+                    Passed on to every Inventory, see Inventory.
+
+    Notes
+    -----
+    Requests for a version that is being valued wait for that calculation instead of starting another one.
+    The valuation of the latest version of every ledger is cached until the ledger changes.
+    cache_stats counts the requests that were answered from the cache
+    or joined a running calculation (hits) and the calculations started (misses).
+    A calculation that fails, such as with SalesMoreThanInventoryError, is not cached.
+    The service must be used from a single event loop.
+
+    """
+
+    def __init__(
+        self,
+        executor: Executor | None = None,
+        max_workers: int | None = None,
+        price_scale: int | None = None,
+    ):
+        self._owns_executor = executor is None
+        self._executor = executor or ProcessPoolExecutor(max_workers)
+        self.price_scale = price_scale
+        self.cache_stats = CacheStats()
+        self._ledgers: dict[str, tuple[list[TransactionBatch], list[TransactionBatch]]] = {}
+        self._versions: dict[str, int] = {}
+        self._cached: dict[str, Valuation] = {}
+        self._running: dict[tuple[str, int], asyncio.Future] = {}
+
+    async def __aenter__(self) -> "ValuationService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts the executor down when the service created it."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def version(self, ledger_id: str) -> int:
+        """The current version of a ledger, 0 when nothing was added."""
+        return self._versions.get(ledger_id, 0)
+
+    def add(
+        self,
+        ledger_id: str,
+        purchases: TransactionBatch | Sequence[Purchases] = (),
+        sales: TransactionBatch | Sequence[Sales] = (),
+    ) -> int:
+        """Adds purchases and sales to a ledger and returns its new version."""
+        purchase_batches, sales_batches = self._ledgers.setdefault(ledger_id, ([], []))
+        purchase_batches.append(_as_batch("purchases", purchases))
+        sales_batches.append(_as_batch("sales", sales))
+        self._versions[ledger_id] = self.version(ledger_id) + 1
+        self._cached.pop(ledger_id, None)
+        return self._versions[ledger_id]
+
+    async def valuation(self, ledger_id: str) -> Valuation:
+        """The valuation of the current version of a ledger.
+
+        Raises
+        ------
+        KeyError
+                        When nothing was added to the ledger.
+        SalesMoreThanInventoryError
+                        When a sale is larger than the inventory on hand.
+        """
+        if ledger_id not in self._ledgers:
+            raise KeyError(ledger_id)
+        version = self._versions[ledger_id]
+        cached = self._cached.get(ledger_id)
+        if cached is not None and cached.version == version:
+            self.cache_stats.hits += 1
+            return cached
+
+        key = (ledger_id, version)
+        running = self._running.get(key)
+        if running is not None:
+            self.cache_stats.hits += 1
+        else:
+            self.cache_stats.misses += 1
+            purchase_batches, sales_batches = self._ledgers[ledger_id]
+            # the batches are joined in the executor, not on the event loop
+            running = asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                _value,
+                ledger_id,
+                version,
+                tuple(purchase_batches),
+                tuple(sales_batches),
+                self.price_scale,
+            )
+            self._running[key] = running
+            running.add_done_callback(lambda future: self._finished(key, future))
+        # a cancelled caller must not cancel the calculation the others are waiting for
+        return await asyncio.shield(running)
+
+    def _finished(self, key: tuple[str, int], future: asyncio.Future) -> None:
+        ledger_id, version = key
+        del self._running[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        if version == self._versions.get(ledger_id):
+            self._cached[ledger_id] = future.result()
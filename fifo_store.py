@@ -0,0 +1,269 @@
+"""
+Fifo Store
+==========
+
+Provides
+	1. Persistent storage of purchases and sales in an SQLite database
+	2. Streaming of the stored transactions in first in first out order into the matching
+
+The transactions are kept in one table, indexed by date and index,
+so they can be read back in first in first out order without sorting
+and without loading the whole table::
+
+	>>> import fifo, fifo_store
+	>>> with fifo_store.TransactionStore("ledger.db") as store:
+	...     store.add(purchase_list + sales_list)
+	...     cogs = sum(x.total_value for x in store.stream_cogs())
+
+"""
+
+from array import array
+from typing import Iterable, Iterator, Tuple
+import itertools
+import os
+import sqlite3
+import threading
+import datetime as dt
+
+from fifo import (
+    Consumption,
+    Purchases,
+    TransactionBatch,
+    _date_ordinals,
+    _index_allocator,
+    _parse_iso_date,
+    _transaction,
+    stream_cogs,
+)
+
+INSERT_CHUNK_SIZE = 1 << 14
+FETCH_SIZE = 1 << 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    classification TEXT NOT NULL CHECK (classification IN ('purchases', 'sales')),
+    date_iso TEXT NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity >= 0),
+    unit_price REAL NOT NULL CHECK (unit_price >= 0),
+    sku TEXT,
+    "index" INTEGER NOT NULL,
+    UNIQUE (classification, "index")
+);
+CREATE INDEX IF NOT EXISTS transactions_fifo_order
+    ON transactions (date_iso, classification, "index");
+"""
+_COLUMNS = 'classification, date_iso, quantity, unit_price, sku, "index"'
+
+
+class TransactionStore:
+    """
+    Purchases and sales stored in an SQLite database.
+
+    Parameters
+    ----------
+    path
+                    The database file, created when missing. ":memory:" keeps the database in memory.
+
+    Notes
+    -----
+    The store holds a single connection for its whole life, every insert and query goes through it.
+    The rows are ordered by date_iso, classification and index, which is the first in first out order
+    since "purchases" sorts before "sales", and that order is served straight from the index.
+
+    """
+
+    def __init__(self, path: str | os.PathLike = ":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "TransactionStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM transactions").fetchone()[0]
+
+    def add(self, transactions: Iterable[Purchases]) -> int:
+        """Inserts purchases and sales in batches, all in one database transaction.
+
+        The transactions are consumed lazily, so a generator of any length can be stored.
+        Returns the number of transactions inserted.
+
+        Raises
+        ------
+        sqlite3.IntegrityError
+                        When a transaction with the same classification and index is already stored,
+                        nothing is inserted then.
+        """
+        rows = (
+            (x.classification, x.date_iso.isoformat(), x.quantity, x.unit_price, x.sku, x.index)
+            for x in transactions
+        )
+        return self._insert(rows)
+
+    def add_batch(self, batch: TransactionBatch) -> int:
+        """Inserts a TransactionBatch column by column, returns the number of rows inserted."""
+        iso_dates = {}
+        for ordinal in set(batch.dates):
+            iso_dates[ordinal] = dt.date.fromordinal(ordinal).isoformat()
+        rows = zip(
+            itertools.repeat(batch.classification),
+            map(iso_dates.__getitem__, batch.dates),
+            batch.quantities,
+            batch.unit_prices,
+            itertools.repeat(None) if batch.skus is None else batch.skus,
+            batch.indices,
+        )
+        return self._insert(rows)
+
+    def _insert(self, rows: Iterator[tuple]) -> int:
+        count = 0
+        with self._lock, self._connection:
+            while chunk := list(itertools.islice(rows, INSERT_CHUNK_SIZE)):
+                self._connection.executemany(
+                    f"INSERT INTO transactions ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", chunk
+                )
+                count += len(chunk)
+        return count
+
+    def _select(
+        self,
+        columns: str,
+        start: dt.date | None,
+        end: dt.date | None,
+        sku: str | None,
+        classification: str | None = None,
+    ) -> sqlite3.Cursor:
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append("date_iso >= ?")
+            parameters.append(start.isoformat())
+        if end is not None:
+            conditions.append("date_iso <= ?")
+            parameters.append(end.isoformat())
+        if sku is not ...:
+            conditions.append("sku IS ?")
+            parameters.append(sku)
+        if classification is not None:
+            conditions.append("classification = ?")
+            parameters.append(classification)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._connection.cursor()
+        cursor.arraysize = FETCH_SIZE
+        return cursor.execute(
+            f'SELECT {columns} FROM transactions {where} ORDER BY date_iso, classification, "index"',
+            parameters,
+        )
+
+    def iter_transactions(
+        self,
+        start: dt.date | None = None,
+        end: dt.date | None = None,
+        sku: str | None = ...,
+    ) -> Iterator[Purchases]:
+        """Yields the stored purchases and sales in first in first out order.
+
+        Parameters
+        ----------
+        start, end : datetime.date, optional
+                        Only the transactions from start up to and including end.
+        sku : str, optional
+                        Only the transactions of one item, None for the transactions without sku.
+        """
+        cursor = self._select(_COLUMNS, start, end, sku)
+        try:
+            while rows := cursor.fetchmany():
+                for classification, date_iso, quantity, unit_price, row_sku, index in rows:
+                    yield _transaction(
+                        classification,
+                        _parse_iso_date(date_iso),
+                        quantity,
+                        unit_price,
+                        row_sku,
+                        index,
+                    )
+        finally:
+            cursor.close()
+
+    def stream_cogs(
+        self,
+        leftover_inventory: list | None = None,
+        start: dt.date | None = None,
+        end: dt.date | None = None,
+        sku: str | None = ...,
+        opening_inventory: Iterable[Purchases] = (),
+    ) -> Iterator[Consumption]:
+        """Matches the stored transactions with fifo.stream_cogs, straight from the database.
+
+        Only the open batches are held in memory, however many rows are stored.
+        When start is given, opening_inventory should hold the open lots on the day before,
+        such as fifo_io.Snapshot.opening_inventory of the period before.
+        """
+        return stream_cogs(
+            itertools.chain(opening_inventory, self.iter_transactions(start, end, sku)),
+            leftover_inventory,
+        )
+
+    def load(
+        self,
+        start: dt.date | None = None,
+        end: dt.date | None = None,
+        sku: str | None = ...,
+    ) -> Tuple[TransactionBatch, TransactionBatch]:
+        """Loads the stored purchases and sales into two sorted TransactionBatch, ready for fifo.Inventory."""
+        batches = []
+        for classification in ("purchases", "sales"):
+            dates, quantities, unit_prices, skus, indices = (
+                array("l"), array("q"), array("d"), [], array("q")
+            )
+            cursor = self._select(
+                'date_iso, quantity, unit_price, sku, "index"', start, end, sku, classification
+            )
+            # converted a fetch at a time, so only the columns are held
+            while rows := cursor.fetchmany():
+                iso_dates, row_quantities, row_prices, row_skus, row_indices = zip(*rows)
+                dates.extend(_date_ordinals(iso_dates))
+                quantities.extend(row_quantities)
+                unit_prices.extend(row_prices)
+                skus.extend(row_skus)
+                indices.extend(row_indices)
+            cursor.close()
+            batches.append(
+                TransactionBatch(
+                    classification,
+                    dates,
+                    quantities,
+                    unit_prices,
+                    indices,
+                    None if all(x is None for x in skus) else skus,
+                )
+            )
+        return batches[0], batches[1]
+
+    def restore_indices(self) -> None:
+        """Moves Purchases.index_global and Sales.index_global, or those of the active
+        fifo.LedgerSequences, past the stored indices.
+
+        Call it after a restart, before new transactions are made, so their indices do not clash.
+        """
+        with self._lock:
+            maximums = dict(
+                self._connection.execute(
+                    'SELECT classification, max("index") FROM transactions GROUP BY classification'
+                )
+            )
+        for classification, maximum in maximums.items():
+            _index_allocator(classification).advance_to(maximum + 1)
@@ -1,11 +1,14 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from tkinter import TclError
 from tkcalendar import DateEntry
 from tktooltip import ToolTip
 import fifo
+import fifo_io
+import concurrent.futures
 import os
 import sys
+import threading
 
 
 
@@ -18,6 +21,21 @@ def resource_path(relative_path):
 	return os.path.join(base_path, relative_path)
 
 
+def oversold_message(error, limit=10):
+	"""The Calculation Error text, listing the sales that are larger than the inventory on hand."""
+	lines = ["You cannot sell more than you have in your inventory!"]
+	for sale in error.oversold[:limit]:
+		lines.append(f"Sales no. {sale.index} on {sale.date_iso.isoformat()} is short by {sale.shortfall}")
+	if len(error.oversold) > limit:
+		lines.append(f"and {len(error.oversold) - limit} more")
+	return "\n".join(lines)
+
+
+def error_message(error):
+	"""The text of an error raised by a BackgroundTask, for a message box."""
+	return f"{type(error).__name__}: {error}"
+
+
 def main():
 	app = Application()
 	app.mainloop()
@@ -54,58 +72,182 @@ class Application(tk.Tk):
 			self.tk.call("wm", "iconphoto", self._w, img)
 		except TclError:
 			pass
-		
-
-		def calculation():
-			cogs.result_list.delete(0, "end")
-			revenue.result_list.delete(0, "end")
-			revenue.result_list2.delete(0, "end")
-			revenue.result_list3.delete(0, "end")
-			frame3.batch_no.delete(0, tk.END)
-			frame3.date_list.delete(0, tk.END)
-			frame3.quantity_list.delete(0, tk.END)
-			frame3.price_list.delete(0, tk.END)
-			frame.get_data()
-			frame2.get_data()
-			calc_result = fifo.Inventory(self.purchase_list, self.sales_list)
-			try:
-				cogs_text = calc_result.cogs()
-			except fifo.SalesMoreThanInventoryError:
-				messagebox.showerror(
-					"Calculation Error",
-					"You cannot sell more than you have in your inventory!",
-				)
-			else:
-				cogs.result_list.insert(tk.END, f"{cogs_text:.2f}")
-				revenue_text = calc_result.sales_revenue()
-				revenue.result_list.delete(0, "end")
-				revenue.result_list.insert(tk.END, f"{revenue_text:.2f}")
-				leftover_inventory = calc_result.leftover_inventory()
-				gross_profit = revenue_text - cogs_text
-				revenue.result_list2.delete(0, "end")
-				revenue.result_list2.insert(tk.END, f"{gross_profit:.2f}")
-				if cogs_text == 0:
-					gross_margin = 0
-				else:
-					gross_margin = (revenue_text - cogs_text) * 100 / revenue_text
-				revenue.result_list3.delete(0, "end")
-				revenue.result_list3.insert(tk.END, f"{gross_margin:.2f}%")
-
-				if leftover_inventory:
-					for i in leftover_inventory:
-						leftover_purchases, leftover_quantity, leftover_price = (
-							i.date_iso,
-							i.quantity,
-							i.unit_price,
-						)
-						frame3.batch_no.insert(tk.END, i.index)
-						frame3.date_list.insert(tk.END, leftover_purchases)
-						frame3.quantity_list.insert(tk.END, leftover_quantity)
-						frame3.price_list.insert(tk.END, f"{leftover_price:.2f}")
-
-		calculate_button = ttk.Button(self, text="Calculate", command=calculation)
-		calculate_button.grid(row=2, column=1, rowspan=2, ipadx=10, ipady=10)
+		self.purchase_form = frame
+		self.sales_form = frame2
+		self.inventory_form = frame3
+		self.cogs_form = cogs
+		self.revenue_form = revenue
+		self.task = None
+
+		menu_bar = tk.Menu(self)
+		file_menu = tk.Menu(menu_bar, tearoff=False)
+		file_menu.add_command(label="Import CSV…", command=self.import_csv)
+		file_menu.add_command(label="Export results…", command=self.export_results)
+		menu_bar.add_cascade(label="File", menu=file_menu)
+		self.config(menu=menu_bar)
+
+		calculate_frame = ttk.Frame(self)
+		calculate_frame.grid(row=2, column=1, rowspan=2)
+		calculate_button = ttk.Button(calculate_frame, text="Calculate", command=self.calculate)
+		calculate_button.grid(row=0, column=0, ipadx=10, ipady=10)
+		self.progress = ttk.Progressbar(calculate_frame, mode="indeterminate", length=100)
+		self.progress.grid(row=1, column=0, pady=5)
+		self.cancel_button = ttk.Button(
+			calculate_frame, text="Cancel", command=self.abandon_task, state="disabled"
+		)
+		self.cancel_button.grid(row=2, column=0)
+
+	def calculate(self):
+		self.abandon_task()
+		self.cogs_form.result_list.delete(0, "end")
+		self.revenue_form.result_list.delete(0, "end")
+		self.revenue_form.result_list2.delete(0, "end")
+		self.revenue_form.result_list3.delete(0, "end")
+		self.inventory_form.table.show(())
+		self.purchase_form.get_data()
+		self.sales_form.get_data()
+		self.start_task(
+			BackgroundTask(value_inventory, list(self.purchase_list), list(self.sales_list)),
+			self.calculation_done,
+		)
+
+	def calculation_done(self, future):
+		try:
+			cogs_text, revenue_text, leftover_inventory = future.result()
+		except fifo.SalesMoreThanInventoryError as error:
+			messagebox.showerror("Calculation Error", oversold_message(error))
+		except Exception as error:
+			messagebox.showerror("Calculation Error", error_message(error))
+		else:
+			self.show_result(cogs_text, revenue_text, leftover_inventory)
+
+	def import_csv(self):
+		path = filedialog.askopenfilename(
+			title="Import CSV", filetypes=(("CSV files", "*.csv"), ("All files", "*.*"))
+		)
+		if path:
+			self.start_task(BackgroundTask(read_transactions, path), self.import_done)
+
+	def import_done(self, future):
+		try:
+			purchase_list, sales_list = future.result()
+		except Exception as error:
+			# any malformed file, such as a bad date or a number out of range
+			messagebox.showerror("Import Error", error_message(error))
+		else:
+			Application.purchase_list.extend(purchase_list)
+			Application.sales_list.extend(sales_list)
+			self.purchase_form.show_transactions()
+			self.sales_form.show_transactions()
+
+	def export_results(self):
+		directory = filedialog.askdirectory(title="Export results", mustexist=True)
+		if directory:
+			self.start_task(
+				BackgroundTask(
+					write_results, directory, list(self.purchase_list), list(self.sales_list)
+				),
+				self.export_done,
+			)
+
+	def export_done(self, future):
+		try:
+			paths = future.result()
+		except fifo.SalesMoreThanInventoryError as error:
+			messagebox.showerror("Calculation Error", oversold_message(error))
+		except Exception as error:
+			messagebox.showerror("Export Error", error_message(error))
+		else:
+			messagebox.showinfo("Export", "Saved\n" + "\n".join(paths))
+
+	def start_task(self, task, done):
+		"""Shows the progress while task runs, done is called with its future once it finished."""
+		self.abandon_task()
+		self.task = task
+		self.progress.start(10)
+		self.cancel_button.state(["!disabled"])
+		self.after(poll_ms, self.poll_task, task, done)
+
+	def abandon_task(self):
+		"""Stops waiting for the running task, its result is dropped when it arrives."""
+		if self.task is None:
+			return
+		self.task = None
+		self.progress.stop()
+		self.cancel_button.state(["disabled"])
+
+	def poll_task(self, task, done):
+		if task is not self.task:
+			# cancelled, or the inputs changed since it started
+			return
+		if not task.future.done():
+			self.after(poll_ms, self.poll_task, task, done)
+			return
+		self.abandon_task()
+		done(task.future)
+
+	def show_result(self, cogs_text, revenue_text, leftover_inventory):
+		cogs, revenue = self.cogs_form, self.revenue_form
+		cogs.result_list.insert(tk.END, f"{cogs_text:.2f}")
+		revenue.result_list.insert(tk.END, f"{revenue_text:.2f}")
+		gross_profit = revenue_text - cogs_text
+		revenue.result_list2.insert(tk.END, f"{gross_profit:.2f}")
+		if cogs_text == 0:
+			gross_margin = 0
+		else:
+			gross_margin = (revenue_text - cogs_text) * 100 / revenue_text
+		revenue.result_list3.insert(tk.END, f"{gross_margin:.2f}%")
+		self.inventory_form.table.show(leftover_inventory)
+
+
+class BackgroundTask:
+	"""function(*args) on a worker thread, so the window keeps responding.
+
+	future holds the result of function or the error raised.
+	A running task cannot be stopped, an abandoned task runs to its end unnoticed.
+	"""
+
+	def __init__(self, function, *args):
+		self.future = concurrent.futures.Future()
+		self.thread = threading.Thread(target=self.run, args=(function, args), daemon=True)
+		self.thread.start()
+
+	def run(self, function, args):
+		try:
+			result = function(*args)
+		except Exception as error:
+			self.future.set_exception(error)
+		else:
+			self.future.set_result(result)
+
+
+def value_inventory(purchase_list, sales_list):
+	"""The cogs, sales revenue and leftover inventory, run by a BackgroundTask."""
+	calc_result = fifo.Inventory(purchase_list, sales_list)
+	return (
+		calc_result.cogs(),
+		calc_result.sales_revenue(),
+		calc_result.leftover_inventory(),
+	)
+
+
+def read_transactions(path):
+	"""The purchases and sales of a CSV file, loaded in batches by fifo_io.read_csv."""
+	purchases, sales = fifo_io.read_csv(path)
+	return list(purchases), list(sales)
+
 
+def write_results(directory, purchase_list, sales_list):
+	"""Writes the cogs slices and the leftover lots to two CSV files in directory, returns their paths."""
+	calc_result = fifo.Inventory(purchase_list, sales_list)
+	cogs_path = os.path.join(directory, "cogs.csv")
+	leftover_path = os.path.join(directory, "leftover_inventory.csv")
+	fifo_io.write_consumption_csv(calc_result.iter_cogs(), cogs_path)
+	fifo_io.write_csv(calc_result.leftover_inventory(), leftover_path)
+	return cogs_path, leftover_path
+
+
+poll_ms = 50
 
 enterkey = "<Enter>"
 leavekey = "<Leave>"
@@ -160,63 +302,13 @@ class InputForm(ttk.Frame):
 		self.button = ttk.Button(self, text=button_label, command=self.get_data)
 		self.button.grid(row=0, column=3)
 
-		self.text_scroll = ttk.Scrollbar(self)
-		self.text_scroll.grid(row=3, column=4)
-
-		self.batch_no = tk.Listbox(
-			self, height=box_height, width=4, yscrollcommand=self.text_scroll.set
-		)
-		self.batch_no.grid(row=3, column=0, sticky="w")
-		self.batch_no.bind(mousewheel, self.on_mouse_wheel)
-
-		self.date_list = tk.Listbox(
-			self,
-			height=box_height,
-			width=list_width,
-			yscrollcommand=self.text_scroll.set,
-		)
-		self.date_list.grid(row=3, column=1, padx=padx_no)
-		self.date_list.bind(mousewheel, self.on_mouse_wheel)
-		self.date_list_tooltip = ToolTip(self.date_list, msg=date_order_msg)
-
-		self.quantity_list = tk.Listbox(
-			self,
-			height=box_height,
-			width=list_width,
-			yscrollcommand=self.text_scroll.set,
-		)
-		self.quantity_list.grid(row=3, column=2, padx=padx_no)
-		self.quantity_list.bind(mousewheel, self.on_mouse_wheel)
-
-		self.price_list = tk.Listbox(
-			self,
-			height=box_height,
-			width=list_width,
-			yscrollcommand=self.text_scroll.set,
-		)
-		self.price_list.grid(row=3, column=3, padx=padx_no)
-		self.price_list.bind(mousewheel, self.on_mouse_wheel)
-
-		self.text_scroll.config(command=self.multiple_yview)
+		self.table = TransactionTable(self, box_height, headings=False)
+		self.table.grid(row=3, column=0, columnspan=5, sticky="w")
+		self.table_tooltip = ToolTip(self.table.tree, msg=date_order_msg)
 
 		self.clear_button = ttk.Button(self, text="Clear", command=self.clear_data)
 		self.clear_button.grid(row=0, column=2)
 
-	def multiple_yview(self, *args):
-		self.batch_no.yview(*args)
-		self.date_list.yview(*args)
-		self.quantity_list.yview(*args)
-		self.price_list.yview(*args)
-
-	def on_mouse_wheel(self, event):
-		self.batch_no.yview(scrollkey, event.delta, "units")
-		self.date_list.yview(scrollkey, event.delta, "units")
-		self.quantity_list.yview(scrollkey, event.delta, "units")
-		self.price_list.yview(scrollkey, event.delta, "units")
-		# this prevents default bindings from firing, which
-		# would end up scrolling the widget twice
-		return "break"
-
 	def get_data(self, event=None):
 		date_entry = self.date.get_date()
 		quantity = self.quantity.get()
@@ -241,23 +333,25 @@ class InputForm(ttk.Frame):
 					if self.name == "Sales":
 						item = fifo.Sales(date_entry, int(quantity), float(price))
 						Application.sales_list.append(item)
-					self.batch_no.insert(tk.END, item.index)
-					self.date_list.insert(tk.END, date_entry)
-					self.quantity_list.insert(tk.END, quantity)
+					self.master.abandon_task()
+					self.show_transactions()
 
 					self.quantity.delete(0, tk.END)
-					self.price_list.insert(tk.END, price)
 					self.price_entry.delete(0, tk.END)
 
+	def show_transactions(self):
+		if self.name == "Purchases":
+			self.table.show(Application.purchase_list, see_end=True)
+		if self.name == "Sales":
+			self.table.show(Application.sales_list, see_end=True)
+
 	def clear_data(self, event=None):
 		if (self.name == "Purchases") and (Application.purchase_list):
 			Application.purchase_list = []
 		if self.name == "Sales" and (Application.sales_list):
 			Application.sales_list = []
-		self.batch_no.delete(0, tk.END)
-		self.date_list.delete(0, tk.END)
-		self.quantity_list.delete(0, tk.END)
-		self.price_list.delete(0, tk.END)
+		self.master.abandon_task()
+		self.show_transactions()
 
 
 class InventoryForm(ttk.Frame):
@@ -266,55 +360,81 @@ class InventoryForm(ttk.Frame):
 
 		padx_no = 5
 		box_height = 4
-		list_width = 17
-
-		self.text_scroll = ttk.Scrollbar(self)
-		self.text_scroll.grid(row=2, column=4)
 
 		self.label = tk.Label(self, text="Leftover Inventory", font={"size": 13})
 		self.label.grid(row=0, column=0, padx=padx_no, columnspan=2, sticky="w")
 
-		self.batch_label = tk.Label(self, text="No.")
-		self.batch_label.grid(row=1, column=0, padx=padx_no)
+		self.table = TransactionTable(self, box_height, price_label="Unit Price ($)")
+		self.table.grid(row=1, column=0, sticky="w")
 
-		self.date_label = tk.Label(self, text="Date")
-		self.date_label.grid(row=1, column=1, padx=padx_no)
 
-		self.quantity_label = tk.Label(self, text="Quantity")
-		self.quantity_label.grid(row=1, column=2, padx=padx_no)
+class TransactionTable(ttk.Frame):
+	"""The No., Date, Quantity and Price of a list of transactions, in a ttk.Treeview.
 
-		self.price_label = tk.Label(self, text="Unit Price ($)")
-		self.price_label.grid(row=1, column=3, padx=padx_no)
+	Only the rows in view are in the tree, they are filled in again on every scroll,
+	so showing and scrolling take the same time however long the list is.
+	The list is shown by reference, call show again after it changed.
+	"""
 
-		self.batch_no = tk.Listbox(self, height=box_height, width=4)
-		self.batch_no.grid(row=2, column=0, sticky="w")
-		self.batch_no.bind(mousewheel, self.on_mouse_wheel)
-
-		self.date_list = tk.Listbox(self, height=box_height, width=list_width)
-		self.date_list.grid(row=2, column=1, padx=padx_no)
-		self.date_list.bind(mousewheel, self.on_mouse_wheel)
-
-		self.quantity_list = tk.Listbox(self, height=box_height, width=list_width)
-		self.quantity_list.grid(row=2, column=2, padx=padx_no)
-		self.quantity_list.bind(mousewheel, self.on_mouse_wheel)
-
-		self.price_list = tk.Listbox(self, height=box_height, width=list_width)
-		self.price_list.grid(row=2, column=3, padx=padx_no)
-		self.price_list.bind(mousewheel, self.on_mouse_wheel)
+	def __init__(self, parent, height: int, headings: bool = True, price_label: str = "Price ($)"):
+		super().__init__(parent)
+		self.height = height
+		self.rows = ()
+		self.offset = 0
 
-		self.text_scroll.config(command=self.multiple_yview)
+		columns = ("batch_no", "date", "quantity", "price")
+		self.tree = ttk.Treeview(
+			self,
+			columns=columns,
+			height=height,
+			show="headings" if headings else "",
+			selectmode="none",
+		)
+		for column, text, width in zip(
+			columns, ("No.", "Date", "Quantity", price_label), (40, 130, 130, 130)
+		):
+			self.tree.heading(column, text=text)
+			self.tree.column(column, width=width, anchor="w", stretch=False)
+		self.tree.grid(row=0, column=0)
+		self.tree.bind(mousewheel, self.on_mouse_wheel)
+
+		self.text_scroll = ttk.Scrollbar(self, command=self.yview)
+		self.text_scroll.grid(row=0, column=1, sticky="ns")
+		self.render()
+
+	def show(self, rows, see_end: bool = False):
+		"""Shows rows, any sequence of transactions, from the top or scrolled to the end."""
+		self.rows = rows
+		self.offset = len(rows) if see_end else 0
+		self.render()
+
+	def render(self):
+		count = len(self.rows)
+		self.offset = max(0, min(self.offset, count - self.height))
+		visible = range(self.offset, min(self.offset + self.height, count))
+		self.tree.delete(*self.tree.get_children())
+		for position in visible:
+			item = self.rows[position]
+			self.tree.insert(
+				"",
+				tk.END,
+				values=(item.index, item.date_iso, item.quantity, f"{item.unit_price:.2f}"),
+			)
+		if count:
+			self.text_scroll.set(visible.start / count, visible.stop / count)
+		else:
+			self.text_scroll.set(0, 1)
 
-	def multiple_yview(self, *args):
-		self.batch_no.yview(*args)
-		self.date_list.yview(*args)
-		self.quantity_list.yview(*args)
-		self.price_list.yview(*args)
+	def yview(self, *args):
+		if args[0] == "moveto":
+			self.offset = round(float(args[1]) * len(self.rows))
+		elif args[0] == scrollkey:
+			step = self.height if args[2] == "pages" else 1
+			self.offset += int(args[1]) * step
+		self.render()
 
 	def on_mouse_wheel(self, event):
-		self.batch_no.yview("scroll", event.delta, "units")
-		self.date_list.yview("scroll", event.delta, "units")
-		self.quantity_list.yview("scroll", event.delta, "units")
-		self.price_list.yview("scroll", event.delta, "units")
+		self.yview(scrollkey, -1 if event.delta > 0 else 1, "units")
 		# this prevents default bindings from firing, which
 		# would end up scrolling the widget twice
 		return "break"
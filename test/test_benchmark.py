@@ -0,0 +1,56 @@
+import unittest
+import os
+import sys
+# include parent directory as well
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fifo import Sales, Purchases, Inventory, MultiInventory
+import benchmark_fifo
+
+
+class TestBenchmark(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_scenarios_are_never_oversold(self):
+		for name, generate in benchmark_fifo.SCENARIOS.items():
+			purchases, sales = generate(3000)
+			self.assertEqual(len(purchases) + len(sales), 3000, name)
+			if name == "multi_sku":
+				self.assertEqual(len(MultiInventory(purchases, sales).skus), 100)
+				MultiInventory(purchases, sales).cogs()
+			else:
+				Inventory(purchases, sales).cogs()
+
+	def test_run(self):
+		results = list(benchmark_fifo.run(["same_day"], [100], repeat=1))
+		self.assertEqual(
+			[x["operation"] for x in results],
+			["construction", "cogs_inventory", "cogs", "leftover_inventory", "sales_revenue", "cogs_money"],
+		)
+		self.assertTrue(all(x["peak_bytes"] is not None for x in results))
+
+	def test_speedup(self):
+		results = list(benchmark_fifo.run(["multi_sku"], [300], repeat=1, memory=False, workers=1))
+		self.assertEqual([x["operation"] for x in results][-2:], ["value_serially", "value_in_parallel"])
+		self.assertGreater(results[-1]["speedup"], 0)
+		self.assertTrue(all("speedup" not in x for x in results[:-1]))
+
+	def test_regressions(self):
+		baseline = [
+			{"scenario": "same_day", "size": 100, "operation": "cogs", "seconds": 0.010, "peak_bytes": 1 << 20},
+			{"scenario": "same_day", "size": 100, "operation": "construction", "seconds": 0.0001, "peak_bytes": 100},
+		]
+		results = [
+			{"scenario": "same_day", "size": 100, "operation": "cogs", "seconds": 0.012, "peak_bytes": 2 << 20},
+			{"scenario": "same_day", "size": 100, "operation": "construction", "seconds": 0.0009, "peak_bytes": 900},
+			{"scenario": "same_day", "size": 1000, "operation": "cogs", "seconds": 1.0, "peak_bytes": None},
+		]
+		found = benchmark_fifo.regressions(results, baseline, tolerance=0.25)
+		self.assertEqual(len(found), 1)
+		self.assertIn("peak_bytes", found[0])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,10 +1,67 @@
 import unittest
+import unittest.mock
 import os
 import sys
 # include parent directory as well
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fifo import Sales, Purchases, Inventory, SalesMoreThanInventoryError
+from fifo import Sales, Purchases, Inventory, SalesMoreThanInventoryError, Consumption, FifoLedger, MultiInventory, value_in_parallel, TransactionBatch, stream_cogs, SequenceAllocator, LedgerSequences, Scenario, OversoldSale
 import datetime as dt
+import copy
+import pickle
+import random
+import tracemalloc
+import fifo
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def legacy_cogs_inventory(inventory):
+	"""The original nested loop implementation of Inventory.cogs_inventory, kept as a reference."""
+	sorted_jobs_list = copy.deepcopy(inventory.sorted_jobs_list)
+	cogs_list = []
+	inventory_list = []
+	for new_sales_item in sorted_jobs_list.copy():
+		if new_sales_item.classification == "purchases":
+			inventory_list.append(new_sales_item)
+			continue
+		if new_sales_item.quantity > sum([y.quantity for y in inventory_list]):
+			raise SalesMoreThanInventoryError
+		for remaining_item_in_inventory in inventory_list.copy():
+			if new_sales_item.quantity == 0:
+				continue
+			leftover_sales_quantity = new_sales_item.quantity - remaining_item_in_inventory.quantity
+			if leftover_sales_quantity > 0:
+				cogs_list.append(copy.deepcopy(remaining_item_in_inventory))
+				inventory_list.remove(remaining_item_in_inventory)
+				new_sales_item.quantity -= remaining_item_in_inventory.quantity
+			else:
+				sales_clone = copy.deepcopy(remaining_item_in_inventory)
+				sales_clone.quantity += leftover_sales_quantity
+				remaining_item_in_inventory.quantity -= sales_clone.quantity
+				new_sales_item.quantity -= sales_clone.quantity
+				cogs_list.append(sales_clone)
+	for i in inventory_list:
+		if i.quantity == 0:
+			inventory_list.remove(i)
+	return cogs_list, inventory_list
+
+
+def random_ledger(seed: int, size: int, oversell: bool = False):
+	"""A reproducible ledger of purchases and sales spread over a single month, created in date order."""
+	rng = random.Random(seed)
+	purchase_list, sales_list = [], []
+	on_hand = 0
+	for date in sorted(dt.date(2024, 5, rng.randint(1, 31)) for _ in range(size)):
+		if rng.random() < 0.5 or on_hand == 0:
+			quantity = rng.randint(1, 20)
+			purchase_list.append(Purchases(date, quantity, round(rng.uniform(1, 5), 2)))
+			on_hand += quantity
+		else:
+			quantity = rng.randint(1, on_hand + 5 if oversell else max(1, on_hand // 3))
+			sales_list.append(Sales(date, quantity, round(rng.uniform(5, 15), 2)))
+			on_hand -= min(quantity, on_hand)
+	rng.shuffle(purchase_list)
+	rng.shuffle(sales_list)
+	return purchase_list, sales_list
 
 class TestPurchases(unittest.TestCase):
 
@@ -188,6 +245,16 @@ class TestInventory(unittest.TestCase):
 		self.assertEqual(self.i2.purchase_list_sorted, self.shuffled_inventory.purchase_list_sorted)
 		self.assertEqual(self.i2.sales_list_sorted, self.shuffled_inventory.sales_list_sorted)
 	
+	def test_sorted_once(self):
+		self.assertIs(self.i2.sorted_jobs_list, self.i2.sorted_jobs_list)
+		self.assertIs(self.i2.transaction_list, self.i2.transaction_list)
+		# already in date order, nothing is sorted
+		self.assertIs(self.i2.purchase_list_sorted, self.i2.purchase_list)
+		shuffled = Inventory([self.p4, self.p3, self.p2, self.p1, self.p0], [self.s4, self.s1, self.s3, self.s2])
+		self.assertIs(shuffled.sales_list_sorted, shuffled.sales_list_sorted)
+		self.assertEqual(shuffled.sorted_jobs_list, self.i2.sorted_jobs_list)
+		self.assertEqual(shuffled.transaction_list, [self.p0, self.p1, self.p2, self.p3, self.p4, self.s1, self.s2, self.s3, self.s4])
+
 	def test_cogs(self):
 		self.assertEqual(self.i1.cogs(), 112.20)
 
@@ -198,5 +265,821 @@ class TestInventory(unittest.TestCase):
 	def test_sales_revenue(self):
 		self.assertEqual(self.i1.sales_revenue(), 350.00)
 
+	def test_cached_result(self):
+		self.assertEqual((self.i1.cache_stats.hits, self.i1.cache_stats.misses), (0, 0))
+		cogs = self.i1.cogs()
+		self.i1.leftover_inventory()
+		self.i1.sales_revenue()
+		self.i1.cogs_inventory()
+		self.assertEqual((self.i1.cache_stats.hits, self.i1.cache_stats.misses), (3, 1))
+		self.assertIs(self.i1.result, self.i1.result)
+		self.assertEqual(self.i1.result.cogs, cogs)
+		self.assertEqual(self.i1.leftover_inventory(), list(self.i1.result.leftover_inventory))
+
+	def test_oversold_is_not_cached(self):
+		inventory = Inventory([self.p1], [self.s1])
+		for _ in range(2):
+			with self.assertRaises(SalesMoreThanInventoryError):
+				inventory.cogs()
+		self.assertEqual((inventory.cache_stats.hits, inventory.cache_stats.misses), (0, 2))
+
+
+class TestOversold(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		Purchases._reset_index()
+		Sales._reset_index()
+		self.purchase_list = [Purchases("2024-05-01", 20, 3), Purchases("2024-05-05", 5, 3.25), Purchases("2024-05-20", 7, 3.55)]
+		# 22 of 20 on hand on the 2nd, 8 of 5 on hand on the 13th, 9 of 5 left on the 20th
+		self.sales_list = [Sales("2024-05-02", 22, 10.00), Sales("2024-05-13", 8, 10.00), Sales("2024-05-20", 2, 10.00), Sales("2024-05-20", 9, 10.00)]
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_all_oversold_sales(self):
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			Inventory(self.purchase_list, self.sales_list).cogs()
+		self.assertEqual(
+			caught.exception.oversold,
+			(OversoldSale(0, dt.date(2024, 5, 2), 2), OversoldSale(1, dt.date(2024, 5, 13), 3), OversoldSale(3, dt.date(2024, 5, 20), 4)),
+		)
+		self.assertIn("3 sales", str(caught.exception))
+		# reduced by their shortfalls, every sale can be filled
+		shortfalls = {x.index: x.shortfall for x in caught.exception.oversold}
+		reduced = [Sales(x.date_iso, x.quantity - shortfalls.get(x.index, 0), x.unit_price) for x in self.sales_list]
+		self.assertEqual(sum(x.quantity for x in Inventory(self.purchase_list, reduced).leftover_inventory()), 0)
+
+	def test_same_for_every_path(self):
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			Inventory(self.purchase_list, self.sales_list).cogs()
+		expected = caught.exception.oversold
+		batches = (
+			TransactionBatch.from_transactions("purchases", self.purchase_list),
+			TransactionBatch.from_transactions("sales", self.sales_list),
+		)
+		calculations = [lambda: Inventory(*batches).cogs()]
+		if fifo.np is not None:
+			calculations.append(lambda: Inventory(self.purchase_list, self.sales_list).cogs_vectorized())
+			for transactions in (batches, (self.purchase_list, self.sales_list)):
+				with unittest.mock.patch.object(fifo, "np", None):
+					with self.assertRaises(SalesMoreThanInventoryError) as caught:
+						Inventory(*transactions).cogs()
+				self.assertEqual(caught.exception.oversold, expected)
+		for calculation in calculations:
+			with self.assertRaises(SalesMoreThanInventoryError) as caught:
+				calculation()
+			self.assertEqual(caught.exception.oversold, expected)
+		self.assertEqual(pickle.loads(pickle.dumps(caught.exception)).oversold, expected)
+
+	def test_random_ledgers(self):
+		for seed in range(20):
+			purchase_list, sales_list = random_ledger(seed, 60, oversell=True)
+			try:
+				Inventory(purchase_list, sales_list).cogs()
+			except SalesMoreThanInventoryError as error:
+				shortfalls = {x.index: x.shortfall for x in error.oversold}
+				self.assertTrue(all(x > 0 for x in shortfalls.values()))
+				reduced = [Sales(x.date_iso, x.quantity - shortfalls.get(x.index, 0), x.unit_price) for x in sales_list]
+				Inventory(purchase_list, reduced).cogs()
+				# a shortfall less on any of them oversells again
+				for index in shortfalls:
+					less = [Sales(x.date_iso, x.quantity - shortfalls.get(x.index, 0) + (x.index == index), x.unit_price) for x in sales_list]
+					with self.assertRaises(SalesMoreThanInventoryError):
+						Inventory(purchase_list, less).cogs()
+
+	def test_every_item(self):
+		purchase_list = [Purchases("2024-05-01", 5, 3, "apple"), Purchases("2024-05-01", 5, 3, "pear")]
+		sales_list = [Sales("2024-05-02", 7, 10.00, "apple"), Sales("2024-05-02", 5, 10.00, "pear"), Sales("2024-05-03", 1, 10.00, "pear")]
+		expected = (
+			OversoldSale(sales_list[0].index, dt.date(2024, 5, 2), 2, "apple"),
+			OversoldSale(sales_list[2].index, dt.date(2024, 5, 3), 1, "pear"),
+		)
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			MultiInventory(purchase_list, sales_list).cogs()
+		self.assertEqual(caught.exception.oversold, expected)
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			value_in_parallel(purchase_list, sales_list, executor=ThreadPoolExecutor(1))
+		self.assertEqual(caught.exception.oversold, expected)
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			value_in_parallel(
+				TransactionBatch.from_transactions("purchases", purchase_list),
+				TransactionBatch.from_transactions("sales", sales_list),
+				executor=ThreadPoolExecutor(1),
+			)
+		self.assertEqual(caught.exception.oversold, expected)
+
+	def test_ledger(self):
+		ledger = FifoLedger()
+		ledger.add_purchase(self.purchase_list[0])
+		with self.assertRaises(SalesMoreThanInventoryError) as caught:
+			ledger.add_sale(self.sales_list[0])
+		self.assertEqual(caught.exception.oversold, (OversoldSale(0, dt.date(2024, 5, 2), 2),))
+
+
+class TestLinearMatching(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def assert_same_as_legacy(self, inventory):
+		try:
+			expected = legacy_cogs_inventory(inventory)
+		except SalesMoreThanInventoryError:
+			with self.assertRaises(SalesMoreThanInventoryError):
+				inventory.cogs_inventory()
+		else:
+			self.assertEqual(expected, inventory.cogs_inventory())
+
+	def test_worked_example(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		p1 = Purchases("2024-05-05", 5, 3.25)
+		p2 = Purchases("2024-05-20", 7, 3.55)
+		p3 = Purchases("2024-05-24", 5, 3.70)
+		s1 = Sales("2024-05-13", 22, 10.00)
+		s2 = Sales("2024-05-31", 13, 10.00)
+		self.assert_same_as_legacy(Inventory([p0, p1, p2, p3], [s1, s2]))
+
+	def test_exactly_depleted_batch(self):
+		p0 = Purchases("2024-05-01", 10, 3)
+		p1 = Purchases("2024-05-02", 5, 4)
+		s1 = Sales("2024-05-03", 10, 10.00)
+		s2 = Sales("2024-05-04", 3, 10.00)
+		self.assert_same_as_legacy(Inventory([p0, p1], [s1]))
+		self.assert_same_as_legacy(Inventory([p0, p1], [s1, s2]))
+		# the records hold no empty slice of the used up batch, only cogs_inventory lists it as before
+		inventory = Inventory([p0, p1], [s1, s2])
+		expected = [Consumption(s1.index, p0.index, p0.date_iso, 10, 3), Consumption(s2.index, p1.index, p1.date_iso, 3, 4)]
+		self.assertEqual(inventory.consumption_records(), expected)
+		self.assertEqual(list(inventory.iter_cogs()), expected)
+		self.assertEqual(list(stream_cogs(inventory.sorted_jobs_list)), expected)
+		ledger = FifoLedger()
+		for x in (p0, p1):
+			ledger.add_purchase(x)
+		for x in (s1, s2):
+			ledger.add_sale(x)
+		self.assertEqual(ledger.consumption_records(), expected)
+		self.assertEqual([x.quantity for x in inventory.cogs_inventory()[0]], [10, 0, 3])
+
+	def test_empty_batch(self):
+		p0 = Purchases("2024-05-01", 0, 3)
+		p1 = Purchases("2024-05-02", 5, 4)
+		p2 = Purchases("2024-05-02", 0, 5)
+		p3 = Purchases("2024-05-02", 5, 6)
+		inventory = Inventory([p0, p1, p2, p3], [Sales("2024-05-03", 7, 10.00)])
+		self.assert_same_as_legacy(inventory)
+		self.assertEqual([(x.purchase_index, x.quantity) for x in inventory.consumption_records()], [(p1.index, 5), (p3.index, 2)])
+
+	def test_random_ledgers(self):
+		for seed in range(50):
+			purchase_list, sales_list = random_ledger(seed, 60)
+			self.assert_same_as_legacy(Inventory(purchase_list, sales_list))
+
+	def test_random_oversold_ledgers(self):
+		for seed in range(50):
+			purchase_list, sales_list = random_ledger(seed, 30, oversell=True)
+			self.assert_same_as_legacy(Inventory(purchase_list, sales_list))
+
+	def test_input_is_not_modified(self):
+		purchase_list, sales_list = random_ledger(7, 40)
+		snapshot = copy.deepcopy((purchase_list, sales_list))
+		inventory = Inventory(purchase_list, sales_list)
+		inventory.cogs_inventory()
+		inventory.consumption_records()
+		self.assertEqual(snapshot, (purchase_list, sales_list))
+		self.assertIs(inventory.purchase_list[0], purchase_list[0])
+
+	def test_consumption_records(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		p1 = Purchases("2024-05-05", 5, 3.25)
+		s1 = Sales("2024-05-13", 22, 10.00)
+		records = Inventory([p0, p1], [s1]).consumption_records()
+		self.assertEqual(
+			records,
+			[
+				Consumption(s1.index, p0.index, p0.date_iso, 20, 3),
+				Consumption(s1.index, p1.index, p1.date_iso, 2, 3.25),
+			],
+		)
+		for seed in range(10):
+			inventory = Inventory(*random_ledger(seed, 60))
+			self.assertAlmostEqual(sum(x.total_value for x in inventory.consumption_records()), inventory.cogs())
+
+
+class TestTransactionBatch(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_concatenate(self):
+		first = TransactionBatch.from_columns("purchases", ["2024-05-05"], [5], [3.25])
+		second = TransactionBatch.from_columns("purchases", ["2024-05-01", "2024-05-02"], [20, 1], [3, 3.5], ["apple", None])
+		batch = TransactionBatch.concatenate("purchases", [first, second])
+		self.assertEqual(list(batch.indices), [0, 1, 2])
+		self.assertEqual(batch.skus, [None, "apple", None])
+		self.assertEqual(list(batch), [*first, *second])
+		self.assertIsNone(TransactionBatch.concatenate("purchases", [first, first]).skus)
+		with self.assertRaises(ValueError):
+			TransactionBatch.concatenate("sales", [first])
+
+	def test_from_columns(self):
+		Purchases("2024-05-01", 20, 3)
+		batch = TransactionBatch.from_columns(
+			"purchases", ["2024-05-05", dt.date(2024, 5, 1), "2024-05-05"], [5, 20, 7], [3.25, 3, 3.55]
+		)
+		self.assertEqual(len(batch), 3)
+		self.assertEqual(list(batch.indices), [1, 2, 3])
+		self.assertEqual(Purchases("2024-05-01", 20, 3).index, 4)
+		self.assertIsInstance(batch[0], Purchases)
+		self.assertEqual((batch[0].date_iso, batch[0].quantity, batch[0].unit_price, batch[0].index), (dt.date(2024, 5, 5), 5, 3.25, 1))
+		self.assertEqual([x.index for x in batch.sorted()], [2, 1, 3])
+		sales = TransactionBatch.from_columns("sales", ["2024-05-13"], [22], [10.00], ["apple"])
+		self.assertIsInstance(sales[0], Sales)
+		self.assertEqual(sales[0].sku, "apple")
+
+	def test_validation(self):
+		with self.assertRaises(ValueError):
+			TransactionBatch.from_columns("purchases", ["2024-05-01"], [-1], [3.00])
+		with self.assertRaisesRegex(ValueError, "Row 1 has a negative unit_price -3.0"):
+			TransactionBatch.from_columns("purchases", ["2024-05-01", "2024-05-02"], [1, 1], [3.00, -3.00])
+		with self.assertRaises(ValueError):
+			TransactionBatch.from_columns("purchases", ["2024-02-30"], [1], [3.00])
+		with self.assertRaises(ValueError):
+			TransactionBatch.from_columns("purchases", ["2024-05-01", "2024-05-02"], [1], [3.00])
+		with self.assertRaises(ValueError):
+			TransactionBatch.from_columns("refunds", ["2024-05-01"], [1], [3.00])
+		with self.assertRaises(TypeError):
+			TransactionBatch.from_columns("purchases", ["2024-05-01"], [1.5], [3.00])
+		with self.assertRaises(TypeError):
+			TransactionBatch.from_columns("purchases", [20240501], [1], [3.00])
+
+	def test_same_as_lists(self):
+		for seed in range(10):
+			purchase_list, sales_list = random_ledger(seed, 60)
+			inventory = Inventory(purchase_list, sales_list)
+			batches = Inventory(
+				TransactionBatch.from_transactions("purchases", purchase_list),
+				TransactionBatch.from_transactions("sales", sales_list),
+			)
+			self.assertIsInstance(batches.purchase_list, TransactionBatch)
+			self.assertEqual(batches.cogs(), inventory.cogs())
+			self.assertEqual(batches.sales_revenue(), inventory.sales_revenue())
+			self.assertEqual(batches.leftover_inventory(), inventory.leftover_inventory())
+			self.assertEqual(batches.consumption_records(), inventory.consumption_records())
+			self.assertEqual(batches.sorted_jobs_list, inventory.sorted_jobs_list)
+
+	def test_oversold(self):
+		purchases = TransactionBatch.from_columns("purchases", ["2024-05-05"], [5], [3.25])
+		sales = TransactionBatch.from_columns("sales", ["2024-05-13"], [22], [10.00])
+		with self.assertRaises(SalesMoreThanInventoryError):
+			Inventory(purchases, sales).cogs()
+
+
+@unittest.skipIf(fifo.np is None, "numpy is not installed")
+class TestCogsVectorized(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def assert_same_as_cogs_inventory(self, inventory):
+		vectorized = inventory.cogs_vectorized()
+		self.assertAlmostEqual(vectorized.cogs, inventory.cogs())
+		sales_cogs = {x.index: 0 for x in inventory.sales_list}
+		for record in inventory.consumption_records():
+			sales_cogs[record.sales_index] += record.total_value
+		for sale, cost in zip(inventory.sales_list_sorted, vectorized.sales_cogs):
+			self.assertAlmostEqual(cost, sales_cogs[sale.index])
+		self.assertEqual(list(vectorized.leftover_inventory), inventory.leftover_inventory())
+
+	def test_worked_example(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		p1 = Purchases("2024-05-05", 5, 3.25)
+		p2 = Purchases("2024-05-20", 7, 3.55)
+		p3 = Purchases("2024-05-24", 5, 3.70)
+		s1 = Sales("2024-05-13", 22, 10.00)
+		s2 = Sales("2024-05-31", 13, 10.00)
+		vectorized = Inventory([p0, p1, p2, p3], [s1, s2]).cogs_vectorized()
+		self.assertAlmostEqual(vectorized.cogs, 112.20)
+		self.assertAlmostEqual(vectorized.sales_cogs[0], 66.50)
+		self.assertAlmostEqual(vectorized.sales_cogs[1], 45.70)
+
+	def test_random_ledgers(self):
+		for seed in range(30):
+			purchase_list, sales_list = random_ledger(seed, 80)
+			purchase_list.append(Purchases("2024-05-15", 0, 2.00))
+			sales_list.append(Sales("2024-05-15", 0, 2.00))
+			self.assert_same_as_cogs_inventory(Inventory(purchase_list, sales_list))
+			self.assert_same_as_cogs_inventory(
+				Inventory(
+					TransactionBatch.from_transactions("purchases", purchase_list),
+					TransactionBatch.from_transactions("sales", sales_list),
+				)
+			)
+
+	def test_empty(self):
+		self.assertEqual(Inventory().cogs_vectorized().cogs, 0)
+		p0 = Purchases("2024-05-01", 20, 3)
+		self.assertEqual(Inventory([p0]).cogs_vectorized().leftover_inventory, (p0,))
+
+	def test_oversold(self):
+		for seed in range(30):
+			inventory = Inventory(*random_ledger(seed, 30, oversell=True))
+			try:
+				inventory.cogs()
+			except SalesMoreThanInventoryError:
+				with self.assertRaises(SalesMoreThanInventoryError):
+					inventory.cogs_vectorized()
+			else:
+				self.assert_same_as_cogs_inventory(inventory)
+
+
+class TestSequenceAllocator(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_threads(self):
+		def create(_):
+			purchases = [Purchases("2024-05-01", 1, 1) for _ in range(500)]
+			batch = TransactionBatch.from_columns("purchases", ["2024-05-01"] * 500, [1] * 500, [1] * 500)
+			return [x.index for x in purchases], list(batch.indices)
+
+		with ThreadPoolExecutor(8) as executor:
+			results = list(executor.map(create, range(8)))
+		indices = [index for single, block in results for index in single + block]
+		self.assertEqual(sorted(indices), list(range(8000)))
+		for _, block in results:
+			self.assertEqual(block, list(range(block[0], block[0] + 500)))
+
+	def test_allocate(self):
+		allocator = SequenceAllocator(10)
+		self.assertEqual(next(allocator), 10)
+		self.assertEqual(allocator.allocate(3), range(11, 14))
+		self.assertEqual(allocator.peek(), 14)
+		allocator.advance_to(12)
+		self.assertEqual(allocator.peek(), 14)
+		allocator.advance_to(20)
+		self.assertEqual(next(allocator), 20)
+		with self.assertRaises(ValueError):
+			allocator.allocate(-1)
+
+	def test_ledgers_are_independent(self):
+		Purchases("2024-05-01", 1, 1)
+
+		def build(_):
+			with LedgerSequences().active() as sequences:
+				p0 = Purchases("2024-05-01", 20, 3)
+				batch = TransactionBatch.from_columns("sales", ["2024-05-02", "2024-05-03"], [1, 2], [10, 10])
+				p1 = Purchases("2024-05-01", 5, 3.25)
+			return p0.index, p1.index, list(batch.indices), sequences.purchases.peek()
+
+		with ThreadPoolExecutor(4) as executor:
+			results = list(executor.map(build, range(4)))
+		self.assertEqual(results, [(0, 1, [0, 1], 2)] * 4)
+		# outside of a ledger the global indices carry on
+		self.assertEqual(Purchases("2024-05-01", 1, 1).index, 1)
+		self.assertEqual(Sales("2024-05-01", 1, 1).index, 0)
+
+
+class TestMoneyMode(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.purchase_list = [
+			Purchases("2024-05-01", 20, 3),
+			Purchases("2024-05-05", 5, 3.25),
+			Purchases("2024-05-20", 7, 3.55),
+			Purchases("2024-05-24", 5, 3.70),
+		]
+		self.sales_list = [Sales("2024-05-13", 22, 10.00), Sales("2024-05-31", 13, 10.00)]
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_exact(self):
+		inventory = Inventory(self.purchase_list, self.sales_list, price_scale=100)
+		self.assertEqual(inventory.cogs(), 112.20)
+		self.assertEqual(inventory.sales_revenue(), 350.00)
+		self.assertEqual((inventory.result.cogs_minor, inventory.result.sales_revenue_minor), (11220, 35000))
+		self.assertEqual(self.purchase_list[2].total_value_minor(100), 2485)
+		self.assertIsNone(Inventory(self.purchase_list, self.sales_list).result.cogs_minor)
+
+	def test_without_numpy(self):
+		with unittest.mock.patch.object(fifo, "np", None):
+			self.assertEqual(Inventory(self.purchase_list, self.sales_list, price_scale=100).cogs(), 112.20)
+			with self.assertRaises(ValueError):
+				Purchases("2024-05-01", 1, 3.555).total_value_minor(100)
+
+	def test_invalid_scale(self):
+		for price_scale in (0, -100):
+			with self.assertRaises(ValueError):
+				Inventory(self.purchase_list, self.sales_list, price_scale=price_scale)
+
+	def test_not_whole_minor_units(self):
+		self.purchase_list.append(Purchases("2024-05-24", 5, 3.705))
+		with self.assertRaises(ValueError):
+			Inventory(self.purchase_list, self.sales_list, price_scale=100).cogs()
+		self.assertEqual(Inventory(self.purchase_list, self.sales_list, price_scale=1000).result.cogs_minor, 112200)
+
+	def test_large_ledger(self):
+		purchase_list, sales_list = random_ledger(8, 2000)
+		inventory = Inventory(purchase_list, sales_list, price_scale=100)
+		records = inventory.consumption_records()
+		self.assertEqual(inventory.result.cogs_minor, sum(x.quantity * round(x.unit_price * 100) for x in records))
+		self.assertEqual(inventory.result.sales_revenue_minor, sum(x.total_value_minor(100) for x in sales_list))
+		batches = Inventory(
+			TransactionBatch.from_transactions("purchases", purchase_list),
+			TransactionBatch.from_transactions("sales", sales_list),
+			price_scale=100,
+		)
+		self.assertEqual(batches.result.cogs_minor, inventory.result.cogs_minor)
+		self.assertEqual(batches.sales_revenue(), inventory.sales_revenue())
+
+
+class TestInstrumentation(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.purchase_list = [
+			Purchases("2024-05-01", 20, 3),
+			Purchases("2024-05-05", 5, 3.25),
+			Purchases("2024-05-20", 7, 3.55),
+			Purchases("2024-05-24", 5, 3.70),
+		]
+		self.sales_list = [Sales("2024-05-13", 22, 10.00), Sales("2024-05-31", 13, 10.00)]
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_counters(self):
+		inventory = Inventory(self.purchase_list, self.sales_list, collect_stats=True)
+		inventory.cogs()
+		stats = inventory.result.stats
+		# 22 takes all 20 of p0 and 2 of p1, 13 takes the last 3 of p1, all 7 of p2 and 3 of p3
+		self.assertEqual((stats.sales_checked, stats.slices, stats.lots_consumed, stats.partial_splits), (2, 5, 3, 2))
+		self.assertGreater(stats.total_seconds, 0)
+		self.assertAlmostEqual(
+			stats.total_seconds, stats.sort_seconds + stats.copy_seconds + stats.check_seconds + stats.match_seconds + stats.value_seconds
+		)
+
+	def test_counters_exact_depletion(self):
+		purchase_list = [Purchases("2024-05-01", 10, 3), Purchases("2024-05-02", 10, 3.25)]
+		# 10 uses up the first batch exactly, 5 only takes from the second
+		sales_list = [Sales("2024-05-03", 10, 10.00), Sales("2024-05-04", 5, 10.00)]
+		inventory = Inventory(purchase_list, sales_list, collect_stats=True)
+		inventory.cogs()
+		stats = inventory.result.stats
+		self.assertEqual((stats.slices, stats.lots_consumed, stats.partial_splits), (2, 1, 1))
+
+	def test_callback(self):
+		exported = []
+		inventory = Inventory(self.purchase_list, self.sales_list, on_stats=exported.append)
+		inventory.cogs()
+		inventory.leftover_inventory()
+		self.assertEqual(len(exported), 1)
+		self.assertIs(exported[0], inventory.result.stats)
+		with self.assertRaises(SalesMoreThanInventoryError):
+			Inventory(self.purchase_list[:1], self.sales_list, on_stats=exported.append).cogs()
+		self.assertEqual(len(exported), 1)
+
+	def test_disabled(self):
+		inventory = Inventory(self.purchase_list, self.sales_list)
+		with unittest.mock.patch.object(fifo.time, "perf_counter", side_effect=AssertionError):
+			inventory.cogs()
+		self.assertIsNone(inventory.result.stats)
+
+
+class TestValuationIndex(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_worked_example(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		p1 = Purchases("2024-05-05", 5, 3.25)
+		p2 = Purchases("2024-05-20", 7, 3.55)
+		p3 = Purchases("2024-05-24", 5, 3.70)
+		s1 = Sales("2024-05-13", 22, 10.00)
+		s2 = Sales("2024-05-31", 13, 10.00)
+		index = Inventory([p0, p1, p2, p3], [s1, s2]).valuation_index()
+		self.assertAlmostEqual(index.cogs_between("2024-05-01", "2024-05-13"), 66.50)
+		self.assertAlmostEqual(index.cogs_between("2024-05-14", "2024-05-31"), 45.70)
+		self.assertEqual(index.cogs_between("2024-05-14", "2024-05-30"), 0)
+		self.assertEqual(index.cogs_between("2024-05-31", "2024-05-01"), 0)
+		self.assertAlmostEqual(index.revenue_between(dt.date(2024, 5, 1), dt.date(2024, 5, 31)), 350.00)
+		self.assertEqual(index.on_hand_as_of("2024-04-30"), 0)
+		self.assertEqual(index.on_hand_as_of("2024-05-13"), 3)
+		self.assertEqual(index.on_hand_as_of("2024-05-31"), 2)
+		self.assertAlmostEqual(index.inventory_value_as_of("2024-05-13"), 9.75)
+		self.assertAlmostEqual(index.inventory_value_as_of("2024-05-31"), 7.40)
+
+	def test_matches_rerunning(self):
+		purchase_list, sales_list = random_ledger(5, 300)
+		inventory = Inventory(purchase_list, sales_list)
+		index = inventory.valuation_index()
+		self.assertIs(index, inventory.valuation_index())
+		dates = sorted({x.date_iso for x in purchase_list + sales_list})
+		for start, end in zip(dates[::7], dates[20::7]):
+			up_to_end = Inventory(
+				[x for x in purchase_list if x.date_iso <= end],
+				[x for x in sales_list if x.date_iso <= end],
+			)
+			before_start = Inventory(
+				[x for x in purchase_list if x.date_iso < start],
+				[x for x in sales_list if x.date_iso < start],
+			)
+			self.assertAlmostEqual(index.cogs_between(start, end), up_to_end.cogs() - before_start.cogs())
+			self.assertAlmostEqual(
+				index.revenue_between(start, end),
+				sum(x.total_value for x in sales_list if start <= x.date_iso <= end),
+			)
+			leftover = up_to_end.leftover_inventory()
+			self.assertEqual(index.on_hand_as_of(end), sum(x.quantity for x in leftover))
+			self.assertAlmostEqual(index.inventory_value_as_of(end), sum(x.total_value for x in leftover))
+
+	def test_batches(self):
+		purchase_list, sales_list = random_ledger(6, 200)
+		index = Inventory(purchase_list, sales_list).valuation_index()
+		batch_index = Inventory(
+			TransactionBatch.from_transactions("purchases", purchase_list),
+			TransactionBatch.from_transactions("sales", sales_list),
+		).valuation_index()
+		self.assertEqual(index, batch_index)
+
+
+class TestStreamCogs(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_same_as_consumption_records(self):
+		for seed in range(20):
+			inventory = Inventory(*random_ledger(seed, 60))
+			self.assertEqual(list(inventory.iter_cogs()), inventory.consumption_records())
+			leftover_inventory = []
+			records = list(stream_cogs(inventory.sorted_jobs_list, leftover_inventory))
+			self.assertEqual(records, inventory.consumption_records())
+			self.assertEqual(leftover_inventory, inventory.leftover_inventory())
+		self.assertEqual(inventory.cache_stats.misses, 1)
+
+	def test_out_of_order(self):
+		p0 = Purchases("2024-05-05", 20, 3)
+		s1 = Sales("2024-05-13", 5, 10.00)
+		with self.assertRaises(ValueError):
+			list(stream_cogs([p0, s1, Purchases("2024-05-01", 20, 3)]))
+		with self.assertRaises(SalesMoreThanInventoryError):
+			list(Inventory([p0], [s1, Sales("2024-05-14", 16, 10.00)]).iter_cogs())
+
+	def test_memory_is_bounded_by_open_batches(self):
+		dates = [dt.date(2020, 1, 1) + dt.timedelta(days=x) for x in range(4000)]
+		# the interned dates are not part of the matching
+		for date in dates:
+			fifo.date_converter(date)
+
+		def transactions(count):
+			for date in dates[:count]:
+				yield Purchases(date, 10, 2.00)
+				yield Sales(date, 10, 5.00)
+
+		tracemalloc.start()
+		for _ in stream_cogs(transactions(4000)):
+			pass
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		# keeping the 8000 transactions or their records alone would take more than 500 KiB
+		self.assertLess(peak, 100 * 1024)
+
+
+class TestFifoLedger(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def add_all(self, ledger, transactions):
+		for transaction in transactions:
+			if transaction.classification == "purchases":
+				ledger.add_purchase(transaction)
+			else:
+				ledger.add_sale(transaction)
+
+	def assert_same_as_inventory(self, ledger, inventory):
+		self.assertAlmostEqual(ledger.cogs(), inventory.cogs())
+		self.assertAlmostEqual(ledger.sales_revenue(), inventory.sales_revenue())
+		self.assertEqual(ledger.leftover_inventory(), inventory.leftover_inventory())
+		self.assertEqual(ledger.consumption_records(), inventory.consumption_records())
+
+	def test_in_order(self):
+		for seed in range(20):
+			purchase_list, sales_list = random_ledger(seed, 80)
+			inventory = Inventory(purchase_list, sales_list)
+			ledger = FifoLedger(checkpoint_interval=8)
+			self.add_all(ledger, inventory.sorted_jobs_list)
+			self.assert_same_as_inventory(ledger, inventory)
+			self.assertEqual(ledger.replayed_events, 0)
+			self.assertEqual(ledger.cogs(), inventory.cogs())
+
+	def test_back_dated(self):
+		for seed in range(20):
+			purchase_list, sales_list = random_ledger(seed, 80)
+			inventory = Inventory(purchase_list, sales_list)
+			transactions = inventory.sorted_jobs_list
+			# some sales arrive late, in reverse order, after everything else
+			late = [x for x in transactions if x.classification == "sales"][-4:]
+			ledger = FifoLedger(checkpoint_interval=8)
+			self.add_all(ledger, [x for x in transactions if x not in late])
+			self.add_all(ledger, reversed(late))
+			self.assert_same_as_inventory(ledger, inventory)
+			self.assertLess(ledger.replayed_events, 3 * len(transactions))
+
+	def test_back_dated_keeps_checkpoints(self):
+		ledger = FifoLedger(checkpoint_interval=16)
+		first_date = dt.date(2024, 1, 1)
+		for day in range(0, 2000, 2):
+			ledger.add_purchase(Purchases(first_date + dt.timedelta(days=day), 1, 3))
+			ledger.add_sale(Sales(first_date + dt.timedelta(days=day + 1), 1, 10.00))
+		checkpoint_count = len(ledger._checkpoints)
+		ledger.add_purchase(Purchases(first_date + dt.timedelta(days=10), 1, 3))
+		# the checkpoints after the back-dated purchase are taken again during its replay
+		self.assertGreaterEqual(len(ledger._checkpoints), checkpoint_count)
+		replayed_events = ledger.replayed_events
+		ledger.add_purchase(Purchases(first_date + dt.timedelta(days=1990), 1, 3))
+		self.assertLessEqual(ledger.replayed_events - replayed_events, 2 * 16)
+		counts = [x.event_count for x in ledger._checkpoints]
+		self.assertTrue(all(0 < b - a <= 16 for a, b in zip(counts, counts[1:])))
+
+	def test_same_day_purchase_is_back_dated(self):
+		p0 = Purchases("2024-05-01", 5, 3)
+		s1 = Sales("2024-05-13", 7, 10.00)
+		p1 = Purchases("2024-05-13", 5, 4)
+		ledger = FifoLedger()
+		ledger.add_purchase(p0)
+		with self.assertRaises(SalesMoreThanInventoryError):
+			ledger.add_sale(s1)
+		ledger.add_purchase(p1)
+		ledger.add_sale(s1)
+		self.assertEqual(ledger.cogs(), 5 * 3 + 2 * 4)
+		self.assertEqual(ledger.watermark, (s1.date_iso, True, s1.index))
+
+	def test_oversold_leaves_ledger_unchanged(self):
+		p0 = Purchases("2024-05-01", 10, 3)
+		s1 = Sales("2024-05-13", 8, 10.00)
+		s2 = Sales("2024-05-05", 5, 10.00)
+		ledger = FifoLedger()
+		ledger.add_purchase(p0)
+		ledger.add_sale(s1)
+		with self.assertRaises(SalesMoreThanInventoryError):
+			ledger.add_sale(s2)
+		self.assert_same_as_inventory(ledger, Inventory([p0], [s1]))
+		with self.assertRaises(TypeError):
+			ledger.add_purchase(s2)
+
+
+class TestMultiInventory(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_sku(self):
+		p0 = Purchases("2024-05-01", 20, 3, "apple")
+		p1 = Purchases("2024-05-01", 20, 3, sku="pear")
+		self.assertEqual(p0.sku, "apple")
+		self.assertIsNone(Sales("2024-05-01", 20, 3).sku)
+		self.assertNotEqual(p0, p1)
+		with self.assertRaises(TypeError):
+			Purchases("2024-05-01", 20, 3, 5)
+		with self.assertRaises(AttributeError):
+			p0.sku = "pear"
+
+	def test_same_as_separate_inventories(self):
+		purchase_list, sales_list = [], []
+		for seed, sku in enumerate(("apple", "pear", None)):
+			purchases, sales = random_ledger(seed, 50)
+			purchase_list += [Purchases(x.date_iso, x.quantity, x.unit_price, sku) for x in purchases]
+			sales_list += [Sales(x.date_iso, x.quantity, x.unit_price, sku) for x in sales]
+		multi = MultiInventory(purchase_list, sales_list)
+		self.assertCountEqual(multi.skus, ["apple", "pear", None])
+		for sku in multi.skus:
+			inventory = Inventory(
+				[x for x in purchase_list if x.sku == sku], [x for x in sales_list if x.sku == sku]
+			)
+			self.assertEqual(multi.cogs(sku), inventory.cogs())
+			self.assertEqual(multi.sales_revenue(sku), inventory.sales_revenue())
+			self.assertEqual(multi.leftover_inventory(sku), inventory.leftover_inventory())
+		self.assertAlmostEqual(multi.cogs(), sum(multi.cogs(sku) for sku in multi.skus))
+		self.assertAlmostEqual(multi.sales_revenue(), sum(x.total_value for x in sales_list))
+		self.assertEqual(
+			sorted(multi.leftover_inventory(), key=lambda k: k.index),
+			sorted(sum((multi.leftover_inventory(sku) for sku in multi.skus), []), key=lambda k: k.index),
+		)
+
+	def test_oversold_item(self):
+		multi = MultiInventory(
+			[Purchases("2024-05-01", 20, 3, "apple")], [Sales("2024-05-02", 5, 3, "pear")]
+		)
+		with self.assertRaises(SalesMoreThanInventoryError):
+			multi.cogs()
+		with self.assertRaises(SalesMoreThanInventoryError):
+			value_in_parallel(multi.purchase_list, multi.sales_list, max_workers=1)
+
+	def test_value_in_parallel(self):
+		purchase_list, sales_list = [], []
+		for seed in range(12):
+			purchases, sales = random_ledger(seed, 40 + seed)
+			purchase_list += [Purchases(x.date_iso, x.quantity, x.unit_price, f"item{seed}") for x in purchases]
+			sales_list += [Sales(x.date_iso, x.quantity, x.unit_price, f"item{seed}") for x in sales]
+		multi = MultiInventory(purchase_list, sales_list)
+		with ProcessPoolExecutor(max_workers=2) as pool:
+			valuation = value_in_parallel(purchase_list, sales_list, executor=pool)
+		self.assertEqual(list(valuation.cogs_by_sku), multi.skus)
+		for sku in multi.skus:
+			self.assertEqual(valuation.cogs_by_sku[sku], multi.cogs(sku))
+			self.assertAlmostEqual(valuation.sales_revenue_by_sku[sku], multi.sales_revenue(sku))
+			self.assertEqual(list(valuation.leftover_by_sku[sku]), multi.leftover_inventory(sku))
+		self.assertEqual(list(valuation.leftover_inventory), multi.leftover_inventory())
+		self.assertAlmostEqual(valuation.cogs, multi.cogs())
+		batch_valuation = value_in_parallel(
+			TransactionBatch.from_transactions("purchases", purchase_list),
+			TransactionBatch.from_transactions("sales", sales_list),
+			executor=ThreadPoolExecutor(2),
+		)
+		self.assertEqual(batch_valuation, valuation)
+
+
+class TestScenarios(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.purchase_list, self.sales_list = random_ledger(21, 1000)
+		self.inventory = Inventory(self.purchase_list, self.sales_list)
+		self.ledger = FifoLedger(checkpoint_interval=32)
+		for transaction in self.inventory.sorted_jobs_list:
+			if transaction.classification == "purchases":
+				self.ledger.add_purchase(transaction)
+			else:
+				self.ledger.add_sale(transaction)
+		self.last_date = self.inventory.sorted_jobs_list[-1].date_iso
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def assert_same_as_inventory(self, result, purchase_list, sales_list):
+		inventory = Inventory(purchase_list, sales_list)
+		self.assertAlmostEqual(result.cogs, inventory.cogs())
+		self.assertAlmostEqual(result.sales_revenue, inventory.sales_revenue())
+		self.assertEqual(list(result.leftover_inventory), inventory.leftover_inventory())
+
+	def test_added_sale(self):
+		sale = Sales(self.last_date, 1, 12.00)
+		result = self.ledger.evaluate(Scenario(added=[sale]))
+		self.assert_same_as_inventory(result, self.purchase_list, self.sales_list + [sale])
+		self.assertLess(result.replayed_events, 100)
+		# the ledger itself is unchanged
+		self.assertAlmostEqual(self.ledger.cogs(), self.inventory.cogs())
+		self.assertEqual(self.ledger.consumption_records(), self.inventory.consumption_records())
+
+	def test_edit_and_removal(self):
+		original = self.inventory.sales_list_sorted[len(self.sales_list) // 2]
+		replacement = Sales(original.date_iso, max(0, original.quantity - 1), original.unit_price)
+		result = self.ledger.evaluate(Scenario.edit(original, replacement))
+		sales_list = [replacement if x is original else x for x in self.sales_list]
+		self.assert_same_as_inventory(result, self.purchase_list, sales_list)
+		self.assertLess(result.replayed_events, len(self.purchase_list) + len(self.sales_list))
+
+		purchase = self.inventory.purchase_list_sorted[-1]
+		result = self.ledger.evaluate(Scenario(removed=[purchase]))
+		self.assert_same_as_inventory(result, [x for x in self.purchase_list if x is not purchase], self.sales_list)
+
+	def test_nothing_changed(self):
+		result = self.ledger.evaluate(Scenario())
+		self.assertEqual(result.replayed_events, 0)
+		self.assertAlmostEqual(result.cogs, self.ledger.cogs())
+		self.assertEqual(list(result.leftover_inventory), self.ledger.leftover_inventory())
+
+	def test_evaluate_all(self):
+		oversold = Scenario(added=[Sales(self.last_date, 10**6, 12.00)])
+		scenarios = [Scenario(added=[Sales(self.last_date, quantity, 12.00)]) for quantity in (1, 2, 3)]
+		expected = [self.ledger.evaluate(x).cogs for x in scenarios]
+		with ThreadPoolExecutor(2) as executor:
+			results = self.ledger.evaluate_all(scenarios + [oversold], executor=executor, return_exceptions=True)
+		self.assertEqual([x.cogs for x in results[:3]], expected)
+		self.assertIsInstance(results[3], SalesMoreThanInventoryError)
+		with self.assertRaises(SalesMoreThanInventoryError):
+			self.ledger.evaluate(oversold)
+		results = self.ledger.evaluate_all(scenarios, max_workers=2)
+		self.assertEqual([x.cogs for x in results], expected)
+
+
 if __name__ == "__main__":
 	unittest.main()
@@ -0,0 +1,227 @@
+import unittest
+import os
+import sys
+# include parent directory as well
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fifo import Sales, Purchases, Inventory, TransactionBatch
+import fifo_io
+import datetime as dt
+import io
+import json
+import tempfile
+
+WORKED_EXAMPLE = """classification,date_iso,quantity,unit_price
+purchases,2024-05-01,20,3
+purchases,2024-05-05,5,3.25
+sales,2024-05-13,22,10.00
+purchases,2024-05-20,7,3.55
+purchases,2024-05-24,5,3.70
+sales,2024-05-31,13,10.00
+"""
+
+
+class TestReadCsv(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_worked_example(self):
+		purchases, sales = fifo_io.read_csv(io.StringIO(WORKED_EXAMPLE))
+		self.assertIsInstance(purchases, TransactionBatch)
+		self.assertEqual(list(purchases.indices), [0, 1, 2, 3])
+		self.assertEqual(list(sales.quantities), [22, 13])
+		self.assertEqual(sales[1].date_iso, dt.date(2024, 5, 31))
+		inventory = Inventory(purchases, sales)
+		self.assertAlmostEqual(inventory.cogs(), 112.20)
+		self.assertAlmostEqual(inventory.sales_revenue(), 350.00)
+
+	def test_path_and_small_chunks(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "ledger.csv")
+			with open(path, "w", newline="") as file:
+				file.write(WORKED_EXAMPLE)
+			chunk_size = fifo_io.CHUNK_SIZE
+			fifo_io.CHUNK_SIZE = 2
+			try:
+				purchases, sales = fifo_io.read_csv(path)
+			finally:
+				fifo_io.CHUNK_SIZE = chunk_size
+		self.assertEqual(list(purchases.quantities), [20, 5, 7, 5])
+		self.assertEqual(list(sales.unit_prices), [10.00, 10.00])
+
+	def test_sku_and_column_order(self):
+		text = "sku;unit_price;quantity;date_iso;classification\napple;3;20;2024-05-01;purchases\n;10;2;2024-05-02;sales\n"
+		purchases, sales = fifo_io.read_csv(io.StringIO(text), delimiter=";")
+		self.assertEqual(purchases[0].sku, "apple")
+		self.assertIsNone(sales[0].sku)
+		self.assertEqual(purchases[0].unit_price, 3.0)
+
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			fifo_io.read_csv(io.StringIO("classification,date_iso,quantity\n"))
+		for row in (
+			"refunds,2024-05-01,20,3",
+			"purchases,2024-02-30,20,3",
+			"purchases,2024-05-01,2.5,3",
+			"purchases,2024-05-01,-20,3",
+			"sales,2024-05-01,20,three",
+		):
+			with self.assertRaises(ValueError):
+				fifo_io.read_csv(io.StringIO("classification,date_iso,quantity,unit_price\n" + row))
+		for row, message in (
+			("sales,2024-05-02,-20,3", "Line 4 has an invalid quantity '-20'"),
+			("sales,2024-05-02,20,-3", "Line 4 has an invalid unit_price '-3'"),
+			("sales,2024-05-02,2.5,3", "Line 4 has an invalid quantity '2.5'"),
+			("sales,2024-02-30,20,3", "Line 4 has an invalid date_iso '2024-02-30'"),
+			("refunds,2024-05-02,20,3", "Line 4 has an invalid classification 'refunds'"),
+		):
+			with self.assertRaisesRegex(ValueError, message):
+				fifo_io.read_csv(io.StringIO("classification,date_iso,quantity,unit_price\npurchases,2024-05-01,20,3\n\n" + row))
+		with self.assertRaisesRegex(ValueError, "Line 4"):
+			fifo_io.read_csv(io.StringIO("classification,date_iso,quantity,unit_price\npurchases,2024-05-01,20,3\n\nsales,2024-05-02\n"))
+
+	def test_blank_lines(self):
+		purchases, sales = fifo_io.read_csv(io.StringIO("\nclassification,date_iso,quantity,unit_price\n\npurchases,2024-05-01,20,3\n\n"))
+		self.assertEqual(list(purchases.quantities), [20])
+		self.assertEqual(len(sales), 0)
+
+
+class TestWriters(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.purchases, self.sales = fifo_io.read_csv(io.StringIO(WORKED_EXAMPLE))
+		self.inventory = Inventory(self.purchases, self.sales)
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_consumption_csv(self):
+		file = io.StringIO()
+		self.assertEqual(fifo_io.write_consumption_csv(self.inventory.iter_cogs(), file), 5)
+		lines = file.getvalue().splitlines()
+		self.assertEqual(lines[0], "sales_index,purchase_index,date_iso,quantity,unit_price,total_value")
+		self.assertEqual(lines[1], "0,0,2024-05-01,20,3.0,60.0")
+		self.assertEqual(len(lines), 6)
+
+	def test_consumption_jsonl(self):
+		file = io.StringIO()
+		self.assertEqual(fifo_io.write_consumption_jsonl(self.inventory.iter_cogs(), file), 5)
+		records = [json.loads(x) for x in file.getvalue().splitlines()]
+		self.assertEqual(records[-1]["quantity"], 3)
+		self.assertEqual(records[-1]["date_iso"], "2024-05-24")
+		self.assertAlmostEqual(sum(x["total_value"] for x in records), 112.20)
+
+	def test_leftover_round_trip(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "leftover.csv")
+			self.assertEqual(fifo_io.write_csv(self.inventory.leftover_inventory(), path), 1)
+			purchases, sales = fifo_io.read_csv(path)
+		self.assertEqual(len(sales), 0)
+		self.assertEqual((purchases[0].date_iso, purchases[0].quantity, purchases[0].unit_price), (dt.date(2024, 5, 24), 2, 3.70))
+
+
+class TestSnapshot(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "2024-05.snap")
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		self.directory.cleanup()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_period_close(self):
+		may_purchases, may_sales = fifo_io.read_csv(io.StringIO(WORKED_EXAMPLE))
+		may = Inventory(may_purchases, may_sales)
+		fifo_io.save_snapshot(fifo_io.Snapshot.close(may, as_of=dt.date(2024, 5, 31)), self.path)
+		Purchases._reset_index()
+		Sales._reset_index()
+
+		# a restart, the counters start again from 0
+		snapshot = fifo_io.load_snapshot(self.path)
+		self.assertEqual(snapshot.as_of, dt.date(2024, 5, 31))
+		self.assertAlmostEqual(snapshot.cogs, 112.20)
+		self.assertAlmostEqual(snapshot.sales_revenue, 350.00)
+		self.assertEqual((snapshot.next_purchase_index, snapshot.next_sales_index), (4, 2))
+		self.assertEqual(snapshot.opening_inventory(), may.leftover_inventory())
+		snapshot.restore_indices()
+		june_purchases = [Purchases("2024-06-03", 10, 3.80)]
+		june_sales = [Sales("2024-06-10", 11, 10.00)]
+		self.assertEqual((june_purchases[0].index, june_sales[0].index), (4, 2))
+
+		june = Inventory(snapshot.opening_inventory() + june_purchases, june_sales)
+		whole_history = Inventory(list(may_purchases) + june_purchases, list(may_sales) + june_sales)
+		self.assertAlmostEqual(june.cogs(), whole_history.cogs() - may.cogs())
+		self.assertEqual(june.leftover_inventory(), whole_history.leftover_inventory())
+		june_close = fifo_io.Snapshot.close(june, previous=snapshot)
+		self.assertAlmostEqual(june_close.cogs, whole_history.cogs())
+		self.assertAlmostEqual(june_close.sales_revenue, whole_history.sales_revenue())
+
+	def test_restore_does_not_go_back(self):
+		fifo_io.save_snapshot(fifo_io.Snapshot(None, TransactionBatch.from_transactions("purchases", [])), self.path)
+		for _ in range(3):
+			Purchases("2024-05-01", 1, 1)
+		fifo_io.load_snapshot(self.path).restore_indices()
+		self.assertEqual(Purchases("2024-05-01", 1, 1).index, 3)
+
+	def test_skus_round_trip(self):
+		lots = [Purchases("2024-05-01", 20, 3, sku="äpfel"), Purchases("2024-05-02", 5, 3.25)]
+		fifo_io.save_snapshot(fifo_io.Snapshot(None, TransactionBatch.from_transactions("purchases", lots)), self.path)
+		snapshot = fifo_io.load_snapshot(self.path)
+		self.assertIsNone(snapshot.as_of)
+		self.assertEqual(snapshot.opening_inventory(), lots)
+
+	def test_invalid(self):
+		fifo_io.save_snapshot(fifo_io.Snapshot(None, TransactionBatch.from_transactions("purchases", [])), self.path)
+		with open(self.path, "r+b") as file:
+			file.seek(8)
+			file.write(b"\xff\x00")
+		with self.assertRaisesRegex(ValueError, "version"):
+			fifo_io.load_snapshot(self.path)
+		with open(self.path, "wb") as file:
+			file.write(b"purchases,2024-05-01,20,3\n" * 4)
+		with self.assertRaisesRegex(ValueError, "Not a snapshot"):
+			fifo_io.load_snapshot(self.path)
+
+
+@unittest.skipIf(fifo_io.pyarrow is None, "pyarrow is not installed")
+class TestReadParquet(unittest.TestCase):
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def write_parquet(self, directory, dates):
+		import pyarrow.parquet
+		table = fifo_io.pyarrow.table(
+			{
+				"classification": ["purchases", "purchases", "sales"],
+				"date_iso": dates,
+				"quantity": [20, 5, 22],
+				"unit_price": [3, 3.25, 10.00],
+				"sku": ["apple", "apple", "apple"],
+			}
+		)
+		path = os.path.join(directory, "ledger.parquet")
+		pyarrow.parquet.write_table(table, path)
+		return path
+
+	def test_dates_and_strings(self):
+		for dates in (
+			["2024-05-01", "2024-05-05", "2024-05-13"],
+			[dt.date(2024, 5, 1), dt.date(2024, 5, 5), dt.date(2024, 5, 13)],
+		):
+			with tempfile.TemporaryDirectory() as directory:
+				purchases, sales = fifo_io.read_parquet(self.write_parquet(directory, dates))
+			self.assertEqual([x.date_iso for x in purchases], [dt.date(2024, 5, 1), dt.date(2024, 5, 5)])
+			self.assertEqual(sales[0].sku, "apple")
+			self.assertAlmostEqual(Inventory(purchases, sales).cogs(), 66.50)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+# include parent directory as well
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fifo import Sales, Purchases, Inventory, SalesMoreThanInventoryError, TransactionBatch
+from test_fifo import random_ledger
+import fifo_service
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TestValuationService(unittest.IsolatedAsyncioTestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.executor = ThreadPoolExecutor(2)
+		self.service = fifo_service.ValuationService(self.executor)
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		self.executor.shutdown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	async def test_coalesced(self):
+		purchase_list, sales_list = random_ledger(3, 2000)
+		self.assertEqual(self.service.add("shop", purchase_list, sales_list), 1)
+		valuations = await asyncio.gather(*(self.service.valuation("shop") for _ in range(20)))
+		self.assertEqual((self.service.cache_stats.hits, self.service.cache_stats.misses), (19, 1))
+		self.assertTrue(all(x is valuations[0] for x in valuations))
+		inventory = Inventory(purchase_list, sales_list)
+		self.assertAlmostEqual(valuations[0].cogs, inventory.cogs())
+		self.assertEqual(list(valuations[0].leftover_inventory), inventory.leftover_inventory())
+		self.assertIs(await self.service.valuation("shop"), valuations[0])
+		self.assertEqual(self.service.cache_stats.hits, 20)
+
+	async def test_new_version(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		s1 = Sales("2024-05-13", 15, 10.00)
+		self.service.add("shop", [p0], [s1])
+		first = await self.service.valuation("shop")
+		self.assertEqual(self.service.add("shop", TransactionBatch.from_columns("purchases", ["2024-05-14"], [5], [3.25]), []), 2)
+		second = await self.service.valuation("shop")
+		self.assertEqual((first.version, second.version), (1, 2))
+		self.assertAlmostEqual(second.cogs, 45.00)
+		self.assertEqual(sum(x.quantity for x in second.leftover_inventory), 10)
+		self.assertEqual(self.service.cache_stats.misses, 2)
+
+	async def test_event_loop_is_not_blocked(self):
+		release = threading.Event()
+		self.service.add("shop", [Purchases("2024-05-01", 20, 3)], [])
+		self.executor.submit(release.wait)
+		self.executor.submit(release.wait)
+		# both workers are busy, the event loop still runs
+		waiting = asyncio.ensure_future(self.service.valuation("shop"))
+		await asyncio.sleep(0.05)
+		self.assertFalse(waiting.done())
+		release.set()
+		self.assertEqual((await waiting).cogs, 0)
+
+	async def test_errors(self):
+		with self.assertRaises(KeyError):
+			await self.service.valuation("missing")
+		self.service.add("shop", [Purchases("2024-05-01", 2, 3)], [Sales("2024-05-02", 3, 10.00)])
+		for _ in range(2):
+			with self.assertRaises(SalesMoreThanInventoryError):
+				await self.service.valuation("shop")
+		self.assertEqual(self.service.cache_stats.misses, 2)
+
+
+class TestValuationServiceProcesses(unittest.IsolatedAsyncioTestCase):
+	async def test_default_executor(self):
+		purchase_list, sales_list = random_ledger(4, 500)
+		async with fifo_service.ValuationService(max_workers=1) as service:
+			service.add("shop", purchase_list, sales_list)
+			valuation = await service.valuation("shop")
+		self.assertAlmostEqual(valuation.cogs, Inventory(purchase_list, sales_list).cogs())
+		Purchases._reset_index()
+		Sales._reset_index()
+
+
+if __name__ == "__main__":
+	unittest.main()
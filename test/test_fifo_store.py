@@ -0,0 +1,80 @@
+import unittest
+import os
+import sys
+# include parent directory as well
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fifo import Sales, Purchases, Inventory, TransactionBatch
+from test_fifo import random_ledger
+import fifo_store
+import datetime as dt
+import sqlite3
+import tempfile
+
+
+class TestTransactionStore(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.store = fifo_store.TransactionStore()
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		self.store.close()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def test_fifo_order(self):
+		s1 = Sales("2024-05-01", 2, 10.00)
+		p1 = Purchases("2024-05-01", 5, 3)
+		p0 = Purchases("2024-04-30", 5, 3)
+		p2 = Purchases("2024-05-01", 5, 3.25)
+		self.assertEqual(self.store.add([s1, p1, p0, p2]), 4)
+		self.assertEqual(len(self.store), 4)
+		self.assertEqual(list(self.store.iter_transactions()), [p0, p1, p2, s1])
+		self.assertEqual(list(self.store.iter_transactions(start=dt.date(2024, 5, 1))), [p1, p2, s1])
+		self.assertEqual(list(self.store.iter_transactions(end=dt.date(2024, 4, 30))), [p0])
+
+	def test_matches_inventory(self):
+		purchase_list, sales_list = random_ledger(13, 500)
+		self.store.add(purchase_list)
+		self.store.add_batch(TransactionBatch.from_transactions("sales", sales_list))
+		inventory = Inventory(purchase_list, sales_list)
+		leftover_inventory = []
+		records = list(self.store.stream_cogs(leftover_inventory))
+		self.assertEqual(records, inventory.consumption_records())
+		self.assertEqual(leftover_inventory, inventory.leftover_inventory())
+		purchases, sales = self.store.load()
+		self.assertEqual(Inventory(purchases, sales).consumption_records(), records)
+
+	def test_sku(self):
+		apple = Purchases("2024-05-01", 5, 3, sku="apple")
+		plain = Purchases("2024-05-01", 5, 3)
+		self.store.add([apple, plain])
+		self.assertEqual(list(self.store.iter_transactions(sku="apple")), [apple])
+		self.assertEqual(list(self.store.iter_transactions(sku=None)), [plain])
+		purchases, _ = self.store.load(sku="apple")
+		self.assertEqual(purchases.skus, ["apple"])
+
+	def test_duplicate_index_inserts_nothing(self):
+		p0 = Purchases("2024-05-01", 5, 3)
+		self.store.add([p0])
+		with self.assertRaises(sqlite3.IntegrityError):
+			self.store.add([Purchases("2024-05-02", 5, 3), p0])
+		self.assertEqual(len(self.store), 1)
+
+	def test_restart(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "ledger.db")
+			with fifo_store.TransactionStore(path) as store:
+				store.add([Purchases("2024-05-01", 20, 3), Purchases("2024-05-05", 5, 3.25), Sales("2024-05-13", 22, 10.00)])
+			Purchases._reset_index()
+			Sales._reset_index()
+			with fifo_store.TransactionStore(path) as store:
+				store.restore_indices()
+				self.assertEqual(Purchases("2024-05-20", 7, 3.55).index, 2)
+				self.assertEqual(Sales("2024-05-31", 1, 10.00).index, 1)
+				self.assertAlmostEqual(sum(x.total_value for x in store.stream_cogs()), 66.50)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+# include parent directory as well
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fifo import Sales, Purchases, Inventory, TransactionBatch
+from test_fifo import legacy_cogs_inventory
+import datetime as dt
+import copy
+import tracemalloc
+
+TRANSACTION_COUNT = 4000
+
+
+def peak_memory(calculation) -> int:
+	"""Peak traced memory in bytes while running calculation, including what it keeps alive."""
+	tracemalloc.start()
+	try:
+		result = calculation()
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	del result
+	return peak
+
+
+class TestMemory(unittest.TestCase):
+	def setUp(self) -> None:
+		super().setUp()
+		self.dates = [
+			(dt.date(2020, 1, 1) + dt.timedelta(days=i // 50)).isoformat()
+			for i in range(TRANSACTION_COUNT // 2)
+		]
+
+	def tearDown(self) -> None:
+		super().tearDown()
+		Purchases._reset_index()
+		Sales._reset_index()
+
+	def legacy(self):
+		# the deepcopy converters and the deepcopying matching of the original Inventory
+		purchase_list = [Purchases(x, 10, 2.50) for x in self.dates]
+		sales_list = [Sales(x, 9, 7.00) for x in self.dates]
+		inventory = Inventory(
+			[copy.deepcopy(x) for x in purchase_list], [copy.deepcopy(x) for x in sales_list]
+		)
+		return purchase_list, sales_list, inventory, legacy_cogs_inventory(inventory)
+
+	def objects(self):
+		purchase_list = [Purchases(x, 10, 2.50) for x in self.dates]
+		sales_list = [Sales(x, 9, 7.00) for x in self.dates]
+		inventory = Inventory(purchase_list, sales_list)
+		return inventory, inventory.cogs(), inventory.leftover_inventory()
+
+	def batches(self):
+		count = len(self.dates)
+		inventory = Inventory(
+			TransactionBatch.from_columns("purchases", self.dates, [10] * count, [2.50] * count),
+			TransactionBatch.from_columns("sales", self.dates, [9] * count, [7.00] * count),
+		)
+		return inventory, inventory.cogs(), inventory.leftover_inventory()
+
+	def test_objects_use_a_third_of_the_memory(self):
+		self.assertGreaterEqual(peak_memory(self.legacy), 3 * peak_memory(self.objects))
+
+	def test_batches_use_a_third_of_the_memory(self):
+		self.assertGreaterEqual(peak_memory(self.legacy), 3 * peak_memory(self.batches))
+
+	def test_interned_dates(self):
+		p0 = Purchases("2024-05-01", 20, 3)
+		p1 = Purchases("2024-05-01", 5, 3.25)
+		s1 = Sales(dt.date(2024, 5, 1), 22, 10.00)
+		self.assertIs(p0.date_iso, p1.date_iso)
+		self.assertIs(p0.date_iso, s1.date_iso)
+
+	def test_no_instance_dict(self):
+		for transaction in (Purchases("2024-05-01", 20, 3), Sales("2024-05-01", 20, 3)):
+			self.assertFalse(hasattr(transaction, "__dict__"))
+			self.assertFalse(hasattr(transaction, "__weakref__"))
+
+
+if __name__ == "__main__":
+	unittest.main()